@@ -1,115 +1,69 @@
 import argparse
-import requests
-import json
 import os
-import time
-from urllib.parse import urlencode
-from dotenv import load_dotenv
-import datetime
 
-load_dotenv()
+import snow_async
+from snow_checkpoint import CHECKPOINT_FILE, export_complete, latest_export_folder
+from snow_export import DEFAULT_SHARDS, fetch_table
+from snow_pagination import DEFAULT_WORKERS
+from snow_output import COMPRESSION_SUFFIXES
+from snow_sync import DEFAULT_STATE_FILE, sync_table
+from table_profiles import profile_names, profile_params, table_profile
 
-token_cache = {'value': None, 'expires': 0}
+PROFILE = table_profile('hr')
+TABLE = PROFILE['table']
 
-def get_bearer_token():
-    global token_cache
-    if time.time() < token_cache['expires']:
-        return token_cache['value']
-
-    url = "https://lendlease.service-now.com/oauth_token.do"
-    payload_dict = {
-        'grant_type': 'password',
-        'username': os.getenv('SNOW_USERNAME'),
-        'password': os.getenv('SNOW_PASSWORD'),
-        'client_id': os.getenv('SNOW_CLIENT_ID'),
-        'client_secret': os.getenv('SNOW_CLIENT_SECRET')
-    }
-    payload = urlencode(payload_dict)
-    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-
-    try:
-        response = requests.post(url, data=payload, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        token_cache = {
-            'value': data['access_token'],
-            'expires': time.time() + data['expires_in'] - 60
-        }
-        return data['access_token']
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Token request failed: {str(e)}")
-        raise SystemExit(1)
-
-def fetch_batch(limit, offset):
-    url = "https://lendlease.service-now.com/api/now/table/sn_hr_core_case"
-    headers = {
-        'Authorization': f'Bearer {get_bearer_token()}',
-    }
-    params = {
-        "sysparm_display_value": "true",
-        "sysparm_view": "Default view",
-        "sysparm_limit": limit,
-        "sysparm_offset": offset
-    }
-
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("result", [])
-    except requests.exceptions.RequestException as e:
-        print(f"❌ API request failed at offset {offset}: {e}")
-        raise SystemExit(1)
-
-def fetch_all_records(batch_size=1000, offset_increment=1001):
-    start_time = time.time()
-
-    offset = 0
-    batch_num = 1
-    total_records = 0
-    all_results = []
-
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    master_folder = f"HR_Tickets_{timestamp}"
-    os.makedirs(master_folder, exist_ok=True)
-
-    while True:
-        print(f"\n🔄 Fetching batch {batch_num} (offset={offset})...")
-        batch = fetch_batch(batch_size, offset)
-        batch_count = len(batch)
-
-        if not batch:
-            print("✅ No more records to fetch. Finished.")
-            break
-
-        # Save each batch to a separate file
-        batch_filename = os.path.join(master_folder, f"records_batch_{batch_num}.json")
-        with open(batch_filename, "w", encoding="utf-8") as f:
-            json.dump(batch, f, indent=2)
-        print(f"📄 Saved {batch_count} records to {batch_filename}")
-
-        all_results.extend(batch)
-        total_records += batch_count
-
-        if batch_count < batch_size:
-            print("ℹ️ Last batch fetched. Ending loop.")
-            break
-
-        offset += offset_increment
-        batch_num += 1
-
-    # Save combined file
-    combined_filename = f"all_records_combined_{timestamp}.json"
-    combined_file = os.path.join(master_folder, combined_filename)
-    with open(combined_file, "w", encoding="utf-8") as f:
-        json.dump(all_results, f, indent=2)
-
-    end_time = time.time()
-    duration = end_time - start_time
-    minutes, seconds = divmod(duration, 60)
-
-    print(f"\n📁 Combined total records saved: {total_records}")
-    print(f"⏱️ Total time taken: {int(minutes)} minutes, {int(seconds)} seconds")
+def fetch_all_records(**options):
+    """Export every sn_hr_core_case record; see snow_export.fetch_table for the options."""
+    return fetch_table(PROFILE, **options)
 
 if __name__ == "__main__":
-    fetch_all_records(batch_size=1000, offset_increment=1001)
+    parser = argparse.ArgumentParser(description='Export every sn_hr_core_case record from ServiceNow')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Records per page (sysparm_limit)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Pages fetched concurrently (offset mode) or shards walked at once (sharded mode)')
+    parser.add_argument('--backend', choices=['threads', 'async'], default='threads',
+                        help='Offset mode transport: thread pool, or asyncio (needs httpx)')
+    parser.add_argument('--concurrency', type=int, default=snow_async.DEFAULT_ASYNC_CONCURRENCY,
+                        help='Pages in flight with --backend async')
+    parser.add_argument('--mode', choices=['offset', 'keyset', 'sharded'], default='offset',
+                        help='offset: concurrent sysparm_offset pages (rows deleted mid-export can be skipped); '
+                             'keyset: continue from the last (sys_updated_on, sys_id); '
+                             'sharded: --workers keyset cursors over sys_created_on ranges')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                        help='sys_created_on ranges of about equal size for --mode sharded')
+    parser.add_argument('--format', choices=['json', 'ndjson', 'sqlite'], default='json',
+                        help='json: batch files plus a combined file; ndjson: stream one record per line; '
+                             'sqlite: upsert into the indexed --store database')
+    parser.add_argument('--compress', choices=[c for c in COMPRESSION_SUFFIXES if c], default=None,
+                        help='Compress the NDJSON stream')
+    parser.add_argument('--profile', choices=profile_names(TABLE), default='full',
+                        help='Field profile controlling sysparm_fields and reference links (see table_profiles.py)')
+    parser.add_argument('--display-value', choices=['true', 'false', 'all'], default=None,
+                        help="Override the profile's sysparm_display_value")
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='FOLDER',
+                        help='Continue an interrupted export (the newest one, or FOLDER) with its original settings')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only fetch records changed since the last run and merge them into --store')
+    parser.add_argument('--store', default=PROFILE['store'], help='Local record store used by --incremental and --format sqlite')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help='High-water mark file used by --incremental')
+    args = parser.parse_args()
+
+    if args.batch_size < 1 or args.workers < 1 or args.shards < 1:
+        parser.error("Batch size, workers and shards must be ≥1")
+    if args.compress and args.format != 'ndjson':
+        parser.error("--compress only applies to --format ndjson")
+
+    params = profile_params(TABLE, args.profile, display_value=args.display_value)
+    resume_folder = None
+    if args.resume:
+        resume_folder = latest_export_folder(PROFILE['folder_prefix'], 'fetch') if args.resume == 'latest' else args.resume
+        if not resume_folder or not os.path.exists(os.path.join(resume_folder, CHECKPOINT_FILE)):
+            parser.error("No interrupted export to resume")
+        if export_complete(resume_folder):
+            parser.error(f"{resume_folder} already finished; run without --resume to start a new export")
+    if args.incremental:
+        sync_table(TABLE, params, args.store, state_file=args.state_file, page_size=args.batch_size)
+    else:
+        fetch_all_records(batch_size=args.batch_size, max_workers=args.workers, mode=args.mode,
+                          output_format=args.format, compression=args.compress, params=params,
+                          backend=args.backend, concurrency=args.concurrency, resume_folder=resume_folder,
+                          store_path=args.store, shards=args.shards)
@@ -7,22 +7,28 @@ import re
 import os
 import argparse
 from docx import Document
-from io import BytesIO
-from PIL import Image
-from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from dotenv import load_dotenv
-from urllib.parse import urlencode
 import html2text
 import html
 from html import unescape
-import shutil
 from html2docx import html2docx
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.shared import Pt
 
-load_dotenv()
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import snow_async
+from snow_attachments import DEFAULT_ATTACHMENT_WORKERS, download_attachments_for_article, prefetch_attachment_index
+from snow_checkpoint import CHECKPOINT_FILE, Checkpoint, export_complete, latest_export_folder, remove_partial_files
+from snow_client import configure_pool, get_session, snow_url
+from snow_images import (DEFAULT_IMAGE_DPI, DEFAULT_IMAGE_WORKERS, DOCX_IMAGE_WIDTH, DOCX_TABLE_IMAGE_WIDTH,
+                         add_image_run, attachment_index, folder_image_index, html_image_placements, image_sys_id,
+                         move_used_images, optimize_images, place_image)
+from table_profiles import profile_params
+
+session = get_session()
 
 def add_hyperlink(paragraph, url, text, styles=None):
     if styles is None:
@@ -114,26 +120,6 @@ def clean_inline_spans(html_content):
     return text
 
 
-def get_bearer_token():
-    url = "https://lendlease.service-now.com/oauth_token.do"
-    payload_dict = {
-        'grant_type': 'password',
-        'username': os.getenv('SNOW_USERNAME'),
-        'password': os.getenv('SNOW_PASSWORD'),
-        'client_id': os.getenv('SNOW_CLIENT_ID'),
-        'client_secret': os.getenv('SNOW_CLIENT_SECRET')
-    }
-    payload = urlencode(payload_dict)
-
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-    }
-    response = requests.post(url, data=payload, headers=headers)
-    print(f"Response Status Code: {response.status_code}")
-    data = response.json()
-    return data['access_token']
-
-
 def clean_html_text(html_content):
     """Convert HTML to clean text"""
     if not html_content:
@@ -184,8 +170,12 @@ def format_kb_article_backup(article):
     return "\n".join(formatted)
 
 
-def format_kb_article_to_docx(doc, article):
-    """Add a formatted knowledge base article to the Word document"""
+def format_kb_article_to_docx(doc, article, images=None, used_images=None):
+    """Add a formatted knowledge base article to the Word document
+
+    images ({attachment sys_id: path}) embeds inline images while the body is
+    built; without it they are left as [IMAGE_PLACEHOLDER:sys_id] runs.
+    """
 
     # Article title/number
     if article.get('number'):
@@ -302,7 +292,7 @@ def format_kb_article_to_docx(doc, article):
     # Main content
     if article.get('text'):
         content_heading = doc.add_heading('Content', level=2)
-        add_html_with_images(doc, article['text'])
+        add_html_with_images(doc, article['text'], images, used_images)
         clean_text = clean_inline_spans(article['text'])  # clean_html_text(article['text'])
 
         # Split content into paragraphs and add them
@@ -312,74 +302,7 @@ def format_kb_article_to_docx(doc, article):
         #         doc.add_paragraph(para_text.strip())
 
 
-def download_attachments_for_article(table_sys_id, output_dir, headers):
-    """Download attachments for a specific KB article and save them in its folder,
-    refresh token if 401 Unauthorized is received."""
-
-    attachment_url = f"https://lendlease.service-now.com/api/now/attachment?sysparm_query=table_sys_id={table_sys_id}"
-
-    def try_download(headers):
-        try:
-            response = requests.get(attachment_url, headers=headers)
-            if response.status_code == 401:
-                return 'unauthorized', None
-            elif response.status_code != 200:
-                print(f"❌ Failed to get attachment list for {table_sys_id}. Status code: {response.status_code}")
-                return 'failed', None
-
-            data = response.json()
-            attachments = data.get('result', [])
-            if not attachments:
-                print(f"📎 No attachments found for {table_sys_id}")
-                return 'empty', None
-
-            print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
-            return 'success', attachments
-        except Exception as e:
-            print(f"❌ Exception while fetching attachments: {e}")
-            return 'error', None
-
-    status, attachments = try_download(headers)
-
-    if status == 'unauthorized':
-        print("🔄 Access token expired, refreshing token...")
-        # Refresh token here and update headers
-        new_token = get_bearer_token()
-        headers['Authorization'] = f'Bearer {new_token}'
-        # Retry once with new token
-        status, attachments = try_download(headers)
-        if status == 'unauthorized':
-            print("❌ Token refresh failed or new token also unauthorized.")
-            return
-        elif status != 'success':
-            return
-
-    if status != 'success':
-        return
-
-    # Download each attachment
-    for attachment in attachments:
-        file_name = attachment.get('file_name')
-        sys_id = attachment.get('sys_id')
-        file_name = f"{sys_id}_{file_name}" if file_name else f"{table_sys_id}_attachment"
-        download_link = attachment.get('download_link')
-        file_size = attachment.get('size_bytes')
-
-        if download_link and file_name:
-            try:
-                file_response = requests.get(download_link, headers=headers)
-                if file_response.status_code == 200:
-                    file_path = os.path.join(output_dir, file_name)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_response.content)
-                    print(f"   ✓ Downloaded: {file_name} ({file_size} bytes)")
-                else:
-                    print(f"   ✗ Failed to download {file_name} (Status {file_response.status_code})")
-            except Exception as e:
-                print(f"   ✗ Error downloading {file_name}: {e}")
-
-
-def add_html_with_images(doc, html_content):
+def add_html_with_images(doc, html_content, images=None, used_images=None):
     soup = BeautifulSoup(html_content, 'html.parser')
 
     def is_inline(elem):
@@ -397,6 +320,11 @@ def add_html_with_images(doc, html_content):
                 parent_paragraph.add_run(text + ' ')
             return parent_paragraph
 
+        elif elem.name == 'img' and images is not None:
+            # Embed the downloaded attachment straight away
+            para = parent_paragraph if parent_paragraph is not None else doc.add_paragraph()
+            add_image_run(para, image_sys_id(elem.get('src')), images, DOCX_IMAGE_WIDTH, used_images)
+            return parent_paragraph
         elif elem.name == 'img':
             # Add image placeholder in a new paragraph
             src = elem.get('src', '')
@@ -415,7 +343,7 @@ def add_html_with_images(doc, html_content):
                 para.add_run(placeholder_text)
             return parent_paragraph
         elif elem.name == 'table':
-            add_html_table(doc, elem)
+            add_html_table(doc, elem, images, used_images)
             return None
         elif elem.name == 'a':
             href = elem.get('href')
@@ -447,7 +375,7 @@ def add_html_with_images(doc, html_content):
     for child in top_level:
         process_element(child, None)
 
-def add_html_table(doc, table_elem):
+def add_html_table(doc, table_elem, images=None, used_images=None):
         rows = table_elem.find_all('tr')
         if not rows:
             return
@@ -470,7 +398,10 @@ def add_html_table(doc, table_elem):
                     if text:
                         parent_paragraph.add_run(text + ' ')
                 elif isinstance(elem, Tag):
-                    if elem.name == 'img':
+                    if elem.name == 'img' and images is not None:
+                        add_image_run(parent_paragraph, image_sys_id(elem.get('src')), images, DOCX_TABLE_IMAGE_WIDTH,
+                                      used_images)
+                    elif elem.name == 'img':
                         src = elem.get('src', '')
                         import re
                         sysid_match = re.search(r'sys_id=([a-zA-Z0-9]+)', src)
@@ -495,58 +426,27 @@ def add_html_table(doc, table_elem):
                 process_cell_content(cell_elem, row.cells[i])
 
 
-def replace_placeholders_with_images(docx_path, local_image_folder, output_path):
+def replace_placeholders_with_images(docx_path, local_image_folder, output_path, images=None, image_dpi=None):
+    """Swap the [IMAGE_PLACEHOLDER:sys_id] runs of a saved document for the downloaded images.
+
+    images ({sys_id: path}, e.g. attachment_index of the downloader's result)
+    defaults to an index of local_image_folder built with a single listing.
+    With image_dpi, images are first scaled to their display width at that
+    resolution (snow_images.optimize_images).
+    """
     doc = Document(docx_path)
-    used_image_folder = os.path.join(local_image_folder, "used_images")
-    os.makedirs(used_image_folder, exist_ok=True)
-    used_sysids = set()
+    if images is None:
+        images = folder_image_index(local_image_folder)
+    used_images = {}
+    placeholders = []
 
     def process_runs(runs, is_in_table=False):
         for run in runs:
-
             if "[IMAGE_PLACEHOLDER:" in run.text:
                 match = re.search(r"\[IMAGE_PLACEHOLDER:([^\]]+)\]", run.text)
                 if match:
-                    sysid = match.group(1)
-                    used_sysids.add(sysid)
-                    found_file = None
-
-                    # Search both main folder and used_images folder in case reused image was already moved
-                    for search_dir in [local_image_folder, used_image_folder]:
-                        for filename in os.listdir(search_dir):
-                            if sysid in filename:
-                                found_file = os.path.join(search_dir, filename)
-                                break
-                        if found_file:
-                            break
-
-                    if found_file:
-
-                        run.clear()
-
-                        with open(found_file, 'rb') as f:
-                            img_stream = BytesIO(f.read())
-                            width = Inches(0.5) if is_in_table else Inches(4)
-                            # run.add_picture(img_stream, width=width)
-                            try:
-                                
-                                img = Image.open(found_file)
-                                buffer = BytesIO()
-                                img.save(buffer, format=img.format)
-                                buffer.seek(0)
-                                run.add_picture(buffer, width=width)
-                            except  Exception as e:
-                                print(f"❌ Failed to add image for sys_id {sysid}. Reason: {e}")
-                                run.text = f"[Failed to insert image: {os.path.basename(found_file)}]"
-                                print("img_stream:", img_stream)
-                                print(f"❌ Error adding image for sys_id {sysid}. Image stream might be empty or invalid.")
-                                # If you want to force it, you could try to open the image with Pillow,
-                                # but that would require a new function or more code than just a try-except.
-                                # If you want to skip, just leave this block empty or put a comment.
-                                pass
-
-                    else:
-                        run.text = f"[No image found for {sysid}]"
+                    width = DOCX_TABLE_IMAGE_WIDTH if is_in_table else DOCX_IMAGE_WIDTH
+                    placeholders.append((run, match.group(1), width))
 
     # Process top-level paragraphs
     for paragraph in doc.paragraphs:
@@ -559,129 +459,253 @@ def replace_placeholders_with_images(docx_path, local_image_folder, output_path)
                 for paragraph in cell.paragraphs:
                     process_runs(paragraph.runs, is_in_table=True)
 
+    if image_dpi:
+        optimize_images([(images[sys_id], width) for _, sys_id, width in placeholders if sys_id in images],
+                        dpi=image_dpi)
+    for run, sys_id, width in placeholders:
+        place_image(run, sys_id, images, width, used_images)
+
     doc.save(output_path)
 
     # Move used images (only once per sys_id)
-    for sysid in used_sysids:
-        for filename in os.listdir(local_image_folder):
-            if sysid in filename:
-                src = os.path.join(local_image_folder, filename)
-                dst = os.path.join(used_image_folder, filename)
-                if not os.path.exists(dst):  # Avoid overwriting if already moved
-                    shutil.move(src, dst)
-                break
-
-# Parse command-line argument for knowledge base ID
-parser = argparse.ArgumentParser(description='Download and export KB articles from ServiceNow')
-parser.add_argument('kb_id', type=str, help='Knowledge Base sys_id (e.g., 01125e5a1b9b685017eeebd22a4bcb44)')
-args = parser.parse_args()
-kb_id = args.kb_id
-
-# Your API call
-#url = f"https://lendlease.service-now.com/api/now/table/kb_knowledge?sysparm_query=sys_class_name!=^publishedISNOTEMPTY^latest=true^kb_knowledge_base={kb_id}&sysparm_display_value=true"
-url = f"https://lendlease.service-now.com/api/now/table/kb_knowledge?sysparm_query=workflow_state=published^active=true^latest=true^publishedISNOTEMPTY^kb_knowledge_base={kb_id}&sysparm_display_value=true"
-payload = {}
-
-token = get_bearer_token()
-headers = {
-    'Authorization': f'Bearer {token}',
-    'Cookie': 'BIGipServerpool_lendlease=c5889ad29f701618e3baa37002034b82; JSESSIONID=3901AC59B602B51CE1CF74C8956FD362; glide_node_id_for_js=fc4812175032dd94c0ff92cf846b17cf27f0dce0a6beb49e12e5c7bb0f48d836; glide_session_store=6360D6592B3D6E50E412F41CD891BF5D; glide_user_activity=U0N2M18xOnRMdkppdFlTN2o2cFlnUVdaQ092UjZ6S0pFdXV0dmZBb3BMcGxVa0hrZ1E9OlVBQWc4QWozUERYQi9mVCs2WDRJa0hTRTgwQjkxMGZkMzUrNGxlUXRNUW89; glide_user_route=glide.5a07cc0a1b859ed021434a69d48daaeb'
-}
-
-try:
-    # Make API request
-    response = requests.request("GET", url, headers=headers, data=payload)
-
-    if response.status_code == 200:
-        # Parse JSON response
-        data = response.json()
-
-        # Generate timestamp for filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # Create Word document
-        doc = Document()
-
-        # Document title and header
-        title = doc.add_heading('Lendlease Knowledge Base Articles', 0)
-        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-        # Document info
-        info_para = doc.add_paragraph()
-        info_para.add_run(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        info_para.add_run(f"Total Articles: {len(data.get('result', []))}")
-        info_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-        # Add separator
-        doc.add_paragraph("_" * 80)
-
-        # Process each article
-        articles = data.get('result', [])
-        for i, article in enumerate(articles):
-            # Generate a new document for each article
-            doc = Document()
-
-            # Document title
-            title = doc.add_heading('Lendlease Knowledge Base Article', 0)
-            title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-            # Article info
-            info_para = doc.add_paragraph()
-            info_para.add_run(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            info_para.add_run(f"Article Number: {article.get('number', 'Unknown')}")
-            info_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-            doc.add_paragraph("_" * 80)
-
-            # Add article content
-            format_kb_article_to_docx(doc, article)
-
-            # Save each article as a separate .docx file
-            safe_article_number = re.sub(r'[^\w\-_. ]', '_', article.get('number', f"article_{i + 1}"))
-            # Create output directory if it doesn't exist
-            # output_dir = "KB_docx_files_{timestamp}".format(timestamp=timestamp)
-            # os.makedirs(output_dir, exist_ok=True)
-            # Create parent directory
-            parent_dir = f"KB_docx_files_{timestamp}"
-            os.makedirs(parent_dir, exist_ok=True)
+    move_used_images(local_image_folder, used_images)
+
+def article_folder(parent_dir, article, i):
+    """Folder an article's DOCX and attachments are written to, named after its number."""
+    article_number = article.get('number', f"article_{i + 1}")
+    return os.path.join(parent_dir, re.sub(r'[^\w\-_. ]', '_', article_number))
+
+
+def download_article_files(article, article_dir, attachments=None):
+    """Download an article's attachments into its folder; returns the downloader's file list."""
+    table_sys_id = article.get('sys_id')
+    if not table_sys_id:
+        print(f"⚠️ No sys_id found for article {os.path.basename(article_dir)}, skipping attachment download.")
+        return []
+    return download_attachments_for_article(table_sys_id, article_dir, attachments=attachments)
+
+
+def export_article(article, article_dir, downloaded, image_dpi=None, image_pool=None):
+    """Build an article's DOCX with its downloaded images embedded and save it once; returns its path.
+
+    Only touches the article's own folder, so --workers runs it in a
+    separate process per article. Images are resized in image_pool, a
+    process pool shared by the whole run, or inline without one.
+    """
+    safe_article_number = os.path.basename(article_dir)
+    images = attachment_index(downloaded)
+    used_images = {}
+    if image_dpi:
+        optimize_images(html_image_placements(article.get('text'), images), dpi=image_dpi, workers=1,
+                        executor=image_pool)
+
+    # Generate a new document for each article
+    doc = Document()
+
+    # Document title
+    title = doc.add_heading('Lendlease Knowledge Base Article', 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Article info
+    info_para = doc.add_paragraph()
+    info_para.add_run(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    info_para.add_run(f"Article Number: {article.get('number', 'Unknown')}")
+    info_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.add_paragraph("_" * 80)
+
+    # Add article content
+    format_kb_article_to_docx(doc, article, images, used_images)
+
+    # Save the .docx file into the folder, once, with its images in place
+    docx_filename = f"kb_article_{safe_article_number}.docx"
+    docx_path = os.path.join(article_dir, docx_filename)
+    doc.save(docx_path)
+    print(f"📄 Saved: {docx_path}")
+    move_used_images(article_dir, used_images)
+    print(f"📊 Processed Inline attachments for article {safe_article_number}")
+    return docx_path
+
+
+def export_articles(pending, checkpoint, downloads=None, workers=1, download_workers=DEFAULT_ATTACHMENT_WORKERS,
+                    image_dpi=None):
+    """Download and build every (index, article, folder) in pending; returns the numbers of failed articles.
+
+    With workers > 1 the DOCX builds (BeautifulSoup parsing, python-docx,
+    image resizing) run in a pool of that many processes. The attachment
+    listings are prefetched in bulk and the downloads fed to it from a
+    shared pool of download_workers threads, each article's build starting
+    as soon as its files are on disk. downloads ({sys_id: files}) skips the
+    download stage when the async backend fetched everything up front.
+    An article that fails is reported and left out of the checkpoint, so
+    --resume retries it; the others carry on.
+    """
+    total = len(pending)
+    failed = []
+    completed = 0
+
+    def finish(i, article, docx_path=None, error=None):
+        nonlocal completed
+        completed += 1
+        article_number = article.get('number', f"article_{i + 1}")
+        if error is not None:
+            print(f"❌ [{completed}/{total}] Article {article_number} failed: {error}")
+            failed.append(article_number)
+            return
+        checkpoint.mark_done('docx', article.get('sys_id') or article_number, docx_path)
+        print(f"✅ [{completed}/{total}] Article {article_number} exported")
+
+    if workers <= 1:
+        # One image pool for the whole run, rather than one per article
+        image_pool = None
+        if image_dpi and DEFAULT_IMAGE_WORKERS > 1:
+            image_pool = ProcessPoolExecutor(max_workers=DEFAULT_IMAGE_WORKERS,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        try:
+            for i, article, article_dir in pending:
+                try:
+                    if downloads is not None:
+                        downloaded = downloads.get(article.get('sys_id'), [])
+                    else:
+                        downloaded = download_article_files(article, article_dir)
+                    docx_path = export_article(article, article_dir, downloaded, image_dpi, image_pool)
+                except Exception as e:
+                    finish(i, article, error=e)
+                    continue
+                finish(i, article, docx_path)
+        finally:
+            if image_pool is not None:
+                image_pool.shutdown()
+        return failed
+
+    listings = {}
+    if downloads is None:
+        listings = prefetch_attachment_index([article.get('sys_id') for _, article, _ in pending])
+        configure_pool(download_workers * DEFAULT_ATTACHMENT_WORKERS)
+    # Spawned rather than forked, so no worker inherits a lock held by a download thread
+    with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix='kb-download') as io_pool, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as cpu_pool:
+        jobs = {}
+
+        def submit_export(job, downloaded):
+            i, article, article_dir = job
+            try:
+                # Images are resized inline; the pool already spreads articles over the cores
+                jobs[cpu_pool.submit(export_article, article, article_dir, downloaded, image_dpi)] = ('export', job)
+            except Exception as e:
+                finish(i, article, error=e)
 
-            # Create subfolder for each article number
-            article_number = article.get('number', f"article_{i + 1}")
-            safe_article_number = re.sub(r'[^\w\-_. ]', '_', article_number)
-            article_dir = os.path.join(parent_dir, safe_article_number)
-            os.makedirs(article_dir, exist_ok=True)
-
-            # Save the .docx file into the folder
-            docx_filename = f"kb_article_{safe_article_number}.docx"
-            docx_path = os.path.join(article_dir, docx_filename)
-            doc.save(docx_path)
-            print(f"📄 Saved: {docx_path}")
-
-            # Download attachments for this article
-            table_sys_id = article.get('sys_id')
-            if table_sys_id:
-                download_attachments_for_article(table_sys_id, article_dir, headers)
+        for job in pending:
+            i, article, article_dir = job
+            if downloads is not None:
+                submit_export(job, downloads.get(article.get('sys_id'), []))
             else:
-                print(f"⚠️ No sys_id found for article {safe_article_number}, skipping attachment download.")
-
-            # After saving the article DOCX (e.g., article_docx_path)
-            replace_placeholders_with_images(
-                docx_path,
-                local_image_folder=article_dir,  # Your attachment folder for the article
-                output_path=os.path.join(article_dir, docx_filename)
-            )
-            print(f"📊 Processed Inline attachments for article {safe_article_number}")
-        print(f"📊 Processed {len(articles)} articles")
-
-
+                future = io_pool.submit(download_article_files, article, article_dir,
+                                        listings.get(article.get('sys_id')))
+                jobs[future] = ('download', job)
+
+        while jobs:
+            done, _ = wait(jobs, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, job = jobs.pop(future)
+                i, article, _ = job
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finish(i, article, error=e)
+                    continue
+                if stage == 'download':
+                    submit_export(job, result)
+                else:
+                    finish(i, article, result)
+    return failed
+
+
+if __name__ == "__main__":
+    # Parse command-line argument for knowledge base ID
+    parser = argparse.ArgumentParser(description='Download and export KB articles from ServiceNow')
+    parser.add_argument('kb_id', type=str, help='Knowledge Base sys_id (e.g., 01125e5a1b9b685017eeebd22a4bcb44)')
+    parser.add_argument('--backend', choices=['threads', 'async'], default='threads',
+                        help='async: download every article\'s attachments on one event loop up front (needs httpx)')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='FOLDER',
+                        help='Continue an interrupted export (the newest one, or FOLDER), skipping finished articles')
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='Scale images down to their display width and recompress them before embedding')
+    parser.add_argument('--image-dpi', type=int, default=DEFAULT_IMAGE_DPI,
+                        help='Resolution the display width is converted to pixels at, with --optimize-images')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Articles built at once, each in its own process (parsing and DOCX writing are CPU-bound)')
+    parser.add_argument('--download-workers', type=int, default=DEFAULT_ATTACHMENT_WORKERS,
+                        help='Articles whose attachments are downloaded at once, feeding --workers')
+    args = parser.parse_args()
+    if args.workers < 1 or args.download_workers < 1:
+        parser.error("Workers and download workers must be ≥1")
+    kb_id = args.kb_id
+    resume_folder = None
+    if args.resume:
+        resume_folder = latest_export_folder("KB_docx_files", 'kb') if args.resume == 'latest' else args.resume
+        if not resume_folder or not os.path.exists(os.path.join(resume_folder, CHECKPOINT_FILE)):
+            parser.error("No interrupted export to resume")
+        if export_complete(resume_folder):
+            parser.error(f"{resume_folder} already finished; run without --resume to start a new export")
+
+    # Your API call
+    #url = snow_url(f"api/now/table/kb_knowledge?sysparm_query=sys_class_name!=^publishedISNOTEMPTY^latest=true^kb_knowledge_base={kb_id}")
+    url = snow_url(f"api/now/table/kb_knowledge?sysparm_query=workflow_state=published^active=true^latest=true^publishedISNOTEMPTY^kb_knowledge_base={kb_id}")
+
+    try:
+        # Make API request
+        response = session.get(url, params=profile_params('kb_knowledge', 'docx'))
+
+        if response.status_code == 200:
+            # Parse JSON response
+            data = response.json()
 
-    else:
-        print(f"❌ API request failed with status code: {response.status_code}")
-        print(f"Response: {response.text[:200]}...")
+            # Generate timestamp for filename
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            parent_dir = resume_folder or f"KB_docx_files_{timestamp}"
+            os.makedirs(parent_dir, exist_ok=True)
+            if resume_folder:
+                remove_partial_files(parent_dir)
+                print(f"⏯️ Resuming {parent_dir}")
+            # Journal of finished articles, so an interrupted export can be resumed
+            checkpoint = Checkpoint(parent_dir)
+            checkpoint.set_meta('export', 'kb')
+
+            # Process each article
+            articles = data.get('result', [])
+            pending = []
+            for i, article in enumerate(articles):
+                if checkpoint.is_done('docx', article.get('sys_id') or article.get('number')):
+                    print(f"⏭️ Article {article.get('number', f'article_{i + 1}')} already exported")
+                    continue
+                # Create subfolder for each article number
+                article_dir = article_folder(parent_dir, article, i)
+                os.makedirs(article_dir, exist_ok=True)
+                pending.append((i, article, article_dir))
+
+            downloads = None
+            if args.backend == 'async':
+                downloads = snow_async.download_all_attachments(
+                    {article['sys_id']: article_dir for _, article, article_dir in pending if article.get('sys_id')})
+
+            failed = export_articles(pending, checkpoint, downloads, workers=args.workers,
+                                     download_workers=args.download_workers,
+                                     image_dpi=args.image_dpi if args.optimize_images else None)
+            print(f"📊 Processed {len(articles)} articles")
+            if failed:
+                print(f"❌ {len(failed)} article(s) failed: {', '.join(failed)} (rerun with --resume to retry them)")
+            else:
+                checkpoint.mark_complete()
+            checkpoint.close()
 
-except requests.exceptions.RequestException as e:
-    print(f"❌ Request failed: {e}")
-except json.JSONDecodeError as e:
-    print(f"❌ Failed to parse JSON response: {e}")
-except Exception as e:
-    print(f"❌ An error occurred: {e}")
+        else:
+            print(f"❌ API request failed with status code: {response.status_code}")
+            print(f"Response: {response.text[:200]}...")
+
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Request failed: {e}")
+    except json.JSONDecodeError as e:
+        print(f"❌ Failed to parse JSON response: {e}")
+    except Exception as e:
+        print(f"❌ An error occurred: {e}")
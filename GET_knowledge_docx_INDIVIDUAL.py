@@ -1,4 +1,3 @@
-import requests
 import json
 from bs4 import BeautifulSoup, NavigableString, Tag
 from datetime import datetime
@@ -6,22 +5,22 @@ import re
 import os
 import argparse
 from docx import Document
-from io import BytesIO
-from PIL import Image
-from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from dotenv import load_dotenv
-from urllib.parse import urlencode
 import html2text
 import html
 from html import unescape
-import shutil
 from html2docx import html2docx
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.shared import Pt
 
-load_dotenv()
+from snow_attachments import download_attachments_for_article
+from snow_client import get_session, snow_url
+from snow_images import (DEFAULT_IMAGE_DPI, DOCX_IMAGE_WIDTH, DOCX_TABLE_IMAGE_WIDTH, attachment_index,
+                         folder_image_index, move_used_images, optimize_images, place_image)
+from table_profiles import profile_params
+
+session = get_session()
 
 def add_hyperlink(paragraph, url, text, styles=None):
     if styles is None:
@@ -113,26 +112,6 @@ def clean_inline_spans(html_content):
     return text
 
 
-def get_bearer_token():
-    url = "https://lendlease.service-now.com/oauth_token.do"
-    payload_dict = {
-        'grant_type': 'password',
-        'username': os.getenv('SNOW_USERNAME'),
-        'password': os.getenv('SNOW_PASSWORD'),
-        'client_id': os.getenv('SNOW_CLIENT_ID'),
-        'client_secret': os.getenv('SNOW_CLIENT_SECRET')
-    }
-    payload = urlencode(payload_dict)
-
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-    }
-    response = requests.post(url, data=payload, headers=headers)
-    print(f"Response Status Code: {response.status_code}")
-    data = response.json()
-    return data['access_token']
-
-
 def clean_html_text(html_content):
     """Convert HTML to clean, linear text without unnecessary line breaks from inline tags like <span>."""
     if not html_content:
@@ -282,73 +261,6 @@ def format_kb_article_to_docx(doc, article):
     #         doc.add_paragraph(para_text.strip())
 
 
-def download_attachments_for_article(table_sys_id, output_dir, headers):
-    """Download attachments for a specific KB article and save them in its folder,
-    refresh token if 401 Unauthorized is received."""
-
-    attachment_url = f"https://lendlease.service-now.com/api/now/attachment?sysparm_query=table_sys_id={table_sys_id}"
-
-    def try_download(headers):
-        try:
-            response = requests.get(attachment_url, headers=headers)
-            if response.status_code == 401:
-                return 'unauthorized', None
-            elif response.status_code != 200:
-                print(f"❌ Failed to get attachment list for {table_sys_id}. Status code: {response.status_code}")
-                return 'failed', None
-
-            data = response.json()
-            attachments = data.get('result', [])
-            if not attachments:
-                print(f"📎 No attachments found for {table_sys_id}")
-                return 'empty', None
-
-            print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
-            return 'success', attachments
-        except Exception as e:
-            print(f"❌ Exception while fetching attachments: {e}")
-            return 'error', None
-
-    status, attachments = try_download(headers)
-
-    if status == 'unauthorized':
-        print("🔄 Access token expired, refreshing token...")
-        # Refresh token here and update headers
-        new_token = get_bearer_token()
-        headers['Authorization'] = f'Bearer {new_token}'
-        # Retry once with new token
-        status, attachments = try_download(headers)
-        if status == 'unauthorized':
-            print("❌ Token refresh failed or new token also unauthorized.")
-            return
-        elif status != 'success':
-            return
-
-    if status != 'success':
-        return
-
-    # Download each attachment
-    for attachment in attachments:
-        file_name = attachment.get('file_name')
-        sys_id = attachment.get('sys_id')
-        file_name = f"{sys_id}_{file_name}" if file_name else f"{table_sys_id}_attachment"
-        download_link = attachment.get('download_link')
-        file_size = attachment.get('size_bytes')
-
-        if download_link and file_name:
-            try:
-                file_response = requests.get(download_link, headers=headers)
-                if file_response.status_code == 200:
-                    file_path = os.path.join(output_dir, file_name)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_response.content)
-                    print(f"   ✓ Downloaded: {file_name} ({file_size} bytes)")
-                else:
-                    print(f"   ✗ Failed to download {file_name} (Status {file_response.status_code})")
-            except Exception as e:
-                print(f"   ✗ Error downloading {file_name}: {e}")
-
-
 def add_html_with_images(doc, html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -466,55 +378,27 @@ def add_html_table(doc, table_elem):
             for i, cell_elem in enumerate(row_cells):
                 process_cell_content(cell_elem, row.cells[i])
 
-def replace_placeholders_with_images(docx_path, local_image_folder, output_path):
+def replace_placeholders_with_images(docx_path, local_image_folder, output_path, images=None, image_dpi=None):
+    """Swap the [IMAGE_PLACEHOLDER:sys_id] runs of a saved document for the downloaded images.
+
+    images ({sys_id: path}, e.g. attachment_index of the downloader's result)
+    defaults to an index of local_image_folder built with a single listing.
+    With image_dpi, images are first scaled to their display width at that
+    resolution (snow_images.optimize_images).
+    """
     doc = Document(docx_path)
-    used_image_folder = os.path.join(local_image_folder, "used_images")
-    os.makedirs(used_image_folder, exist_ok=True)
-    used_sysids = set()
+    if images is None:
+        images = folder_image_index(local_image_folder)
+    used_images = {}
+    placeholders = []
 
     def process_runs(runs, is_in_table=False):
         for run in runs:
             if "[IMAGE_PLACEHOLDER:" in run.text:
                 match = re.search(r"\[IMAGE_PLACEHOLDER:([^\]]+)\]", run.text)
                 if match:
-                    sysid = match.group(1)
-                    used_sysids.add(sysid)
-                    found_file = None
-
-                    # Search both main folder and used_images folder in case reused image was already moved
-                    for search_dir in [local_image_folder, used_image_folder]:
-                        for filename in os.listdir(search_dir):
-                            if sysid in filename:
-                                found_file = os.path.join(search_dir, filename)
-                                break
-                        if found_file:
-                            break
-
-                    if found_file:
-                        run.clear()
-                        with open(found_file, 'rb') as f:
-                            img_stream = BytesIO(f.read())
-                            width = Inches(0.5) if is_in_table else Inches(4)
-                            # run.add_picture(img_stream, width=width)
-                            try:
-                                
-                                img = Image.open(found_file)
-                                buffer = BytesIO()
-                                img.save(buffer, format=img.format)
-                                buffer.seek(0)
-                                run.add_picture(buffer, width=width)
-                            except  Exception as e:
-                                print(f"❌ Failed to add image for sys_id {sysid}. Reason: {e}")
-                                run.text = f"[Failed to insert image: {os.path.basename(found_file)}]"
-                                print("img_stream:", img_stream)
-                                print(f"❌ Error adding image for sys_id {sysid}. Image stream might be empty or invalid.")
-                                # If you want to force it, you could try to open the image with Pillow,
-                                # but that would require a new function or more code than just a try-except.
-                                # If you want to skip, just leave this block empty or put a comment.
-                                pass
-
-                    else:
-                        run.text = f"[No image found for {sysid}]"
+                    width = DOCX_TABLE_IMAGE_WIDTH if is_in_table else DOCX_IMAGE_WIDTH
+                    placeholders.append((run, match.group(1), width))
 
     # Process top-level paragraphs
     for paragraph in doc.paragraphs:
@@ -527,17 +411,17 @@ def replace_placeholders_with_images(docx_path, local_image_folder, output_path)
                 for paragraph in cell.paragraphs:
                     process_runs(paragraph.runs, is_in_table=True)
 
+    if image_dpi:
+        optimize_images([(images[sys_id], width) for _, sys_id, width in placeholders if sys_id in images],
+                        dpi=image_dpi)
+    for run, sys_id, width in placeholders:
+        place_image(run, sys_id, images, width, used_images)
+
     doc.save(output_path)
 
     # Move used images (only once per sys_id)
-    for sysid in used_sysids:
-        for filename in os.listdir(local_image_folder):
-            if sysid in filename:
-                src = os.path.join(local_image_folder, filename)
-                dst = os.path.join(used_image_folder, filename)
-                if not os.path.exists(dst):  # Avoid overwriting if already moved
-                    shutil.move(src, dst)
-                break
+    move_used_images(local_image_folder, used_images)
+
 # # Parse command-line argument for knowledge base ID
 # parser = argparse.ArgumentParser(description='Download and export KB articles from ServiceNow')
 # parser.add_argument('kb_id', type=str, help='Knowledge Base sys_id (e.g., 01125e5a1b9b685017eeebd22a4bcb44)')
@@ -546,25 +430,22 @@ def replace_placeholders_with_images(docx_path, local_image_folder, output_path)
 
 
 # # Your API call
-# url = f"https://lendlease.service-now.com/api/now/table/kb_knowledge?sysparm_query=sys_class_name!=^publishedISNOTEMPTY^latest=true^kb_knowledge_base={kb_id}&sysparm_display_value=true"
+# url = snow_url(f"api/now/table/kb_knowledge?sysparm_query=sys_class_name!=^publishedISNOTEMPTY^latest=true^kb_knowledge_base={kb_id}")
 
 # Parse command-line argument for specific article number
 parser = argparse.ArgumentParser(description='Download and export a specific KB article from ServiceNow')
 parser.add_argument('article_number', type=str, help='KB article number (e.g., KB0012345)')
+parser.add_argument('--optimize-images', action='store_true',
+                    help='Scale images down to their display width and recompress them before embedding')
+parser.add_argument('--image-dpi', type=int, default=DEFAULT_IMAGE_DPI,
+                    help='Resolution the display width is converted to pixels at, with --optimize-images')
 args = parser.parse_args()
 article_number = args.article_number
 
 # Updated API call to get only one article by number
-url = f"https://lendlease.service-now.com/api/now/table/kb_knowledge?sysparm_query=number={article_number}&sysparm_display_value=true"
-
-payload = {}
+url = snow_url(f"api/now/table/kb_knowledge?sysparm_query=number={article_number}")
 
-token = get_bearer_token()
-headers = {
-    'Authorization': f'Bearer {token}',
-    'Cookie': 'BIGipServerpool_lendlease=c5889ad29f701618e3baa37002034b82; JSESSIONID=3901AC59B602B51CE1CF74C8956FD362; glide_node_id_for_js=fc4812175032dd94c0ff92cf846b17cf27f0dce0a6beb49e12e5c7bb0f48d836; glide_session_store=6360D6592B3D6E50E412F41CD891BF5D; glide_user_activity=U0N2M18xOnRMdkppdFlTN2o2cFlnUVdaQ092UjZ6S0pFdXV0dmZBb3BMcGxVa0hrZ1E9OlVBQWc4QWozUERYQi9mVCs2WDRJa0hTRTgwQjkxMGZkMzUrNGxlUXRNUW89; glide_user_route=glide.5a07cc0a1b859ed021434a69d48daaeb'
-}
-response = requests.get(url, headers=headers)
+response = session.get(url, params=profile_params('kb_knowledge', 'docx'))
 
 if response.status_code != 200:
     print(f"❌ Failed to fetch article {article_number}. Status code: {response.status_code}")
@@ -583,7 +464,7 @@ output_dir = os.path.join(parent_dir, article_number)
 os.makedirs(output_dir, exist_ok=True)
 
 # Download attachments
-download_attachments_for_article(article['sys_id'], output_dir, headers)
+downloaded = download_attachments_for_article(article['sys_id'], output_dir)
 
 # Generate DOCX
 doc = Document()
@@ -595,6 +476,7 @@ final_docx_path = os.path.join(output_dir, f"{article_number}.docx")
 doc.save(final_docx_path)
 
 # Replace image placeholders
-replace_placeholders_with_images(final_docx_path, output_dir, final_docx_path)
+replace_placeholders_with_images(final_docx_path, output_dir, final_docx_path, images=attachment_index(downloaded),
+                                 image_dpi=args.image_dpi if args.optimize_images else None)
 
 print(f"✅ DOCX generated at: {final_docx_path}")
\ No newline at end of file
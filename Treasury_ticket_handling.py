@@ -1,151 +1,74 @@
-import requests
 import os
 import json
 import argparse
-from urllib.parse import urlencode
-from dotenv import load_dotenv
-from datetime import datetime
 
-load_dotenv()
+from snow_async import DEFAULT_ASYNC_CONCURRENCY
+from snow_attachments import ATTACHMENT_CACHE_DIR, DEFAULT_ATTACHMENT_WORKERS, AttachmentCache
+from snow_checkpoint import CHECKPOINT_FILE, export_complete, latest_export_folder
+from snow_export import download_pdf, download_ticket_files, pdf_url
+from snow_pipeline import DEFAULT_PDF_WORKERS
+from snow_store import RecordStore, add_query_arguments, query_from_args
+from table_profiles import table_profile
 
-def get_bearer_token():
-    url = "https://lendlease.service-now.com/oauth_token.do"
-    payload_dict = {
-        'grant_type': 'password',
-        'username': os.getenv('SNOW_USERNAME'),
-        'password': os.getenv('SNOW_PASSWORD'),
-        'client_id': os.getenv('SNOW_CLIENT_ID'),
-        'client_secret': os.getenv('SNOW_CLIENT_SECRET')
-    }
-    payload = urlencode(payload_dict)
-    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
 
-    response = requests.post(url, data=payload, headers=headers)
-    print(f"🔑 Token request status: {response.status_code}")
-    data = response.json()
-    return data['access_token']
+PROFILE = table_profile('treasury')
+TABLE = PROFILE['table']
 
 
-def download_attachments_for_article(table_sys_id, output_dir, headers):
-    attachment_url = f"https://lendlease.service-now.com/api/now/attachment?sysparm_query=table_sys_id={table_sys_id}"
+def servicenow_pdf_url(sys_id):
+    return pdf_url(PROFILE, sys_id)
 
-    def try_download(headers):
-        try:
-            response = requests.get(attachment_url, headers=headers)
-            if response.status_code == 401:
-                return 'unauthorized', None
-            elif response.status_code != 200:
-                print(f"❌ Failed to get attachments for {table_sys_id}. Status: {response.status_code}")
-                return 'failed', None
 
-            data = response.json()
-            attachments = data.get('result', [])
-            if not attachments:
-                print(f"📎 No attachments found for {table_sys_id}")
-                return 'empty', None
+def download_servicenow_pdf(sys_id, pdf_dir):
+    return download_pdf(PROFILE, sys_id, pdf_dir)
 
-            print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
-            return 'success', attachments
-        except Exception as e:
-            print(f"❌ Exception: {e}")
-            return 'error', None
 
-    status, attachments = try_download(headers)
-
-    if status == 'unauthorized':
-        print("🔄 Refreshing token for attachment download...")
-        headers['Authorization'] = f'Bearer {get_bearer_token()}'
-        status, attachments = try_download(headers)
-        if status != 'success':
-            return
-
-    if status != 'success':
-        return
-
-    for attachment in attachments:
-        file_name = attachment.get('file_name')
-        sys_id = attachment.get('sys_id')
-        file_name = f"{sys_id}_{file_name}" if file_name else f"{table_sys_id}_attachment"
-        download_link = attachment.get('download_link')
-        file_size = attachment.get('size_bytes')
-
-        if download_link and file_name:
-            try:
-                file_response = requests.get(download_link, headers=headers)
-                if file_response.status_code == 200:
-                    file_path = os.path.join(output_dir, file_name)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_response.content)
-                    print(f"   ✓ Downloaded attachment: {file_name} ({file_size} bytes)")
-                else:
-                    print(f"   ✗ Failed to download {file_name} (Status {file_response.status_code})")
-            except Exception as e:
-                print(f"   ✗ Error downloading {file_name}: {e}")
-
-
-def download_servicenow_pdf(sys_id, pdf_dir, headers):
-
-    url = f"https://lendlease.service-now.com/x_llusn_bankg_bi_req.do?PDF&sys_id={sys_id}&sysparm_view=Default%20view"
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 401:
-        print("🔄 Token expired while downloading PDF, refreshing token...")
-        bearer_token = get_bearer_token()
-        headers['Authorization'] = f'Bearer {bearer_token}'
-        response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        filename = f"{sys_id}.pdf"
-        file_path = os.path.join(pdf_dir, filename)
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        print(f"   ✓ PDF successfully saved as {file_path}")
-    else:
-        print(f"   ✗ Failed to download PDF for sys_id {sys_id}. Status: {response.status_code}")
-        print(response.text)
-
-
-def download_all_attachments_and_pdfs(json_file, headers):
-    with open(json_file, 'r') as f:
-        response_data = json.load(f)
-
-    tickets = response_data.get("result", [])
-    print(f"🎫 Processing {len(tickets)} ticket(s)...")
-
-    # Create master folder with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-    master_folder = f"Treasury_Tickets_{timestamp}"
-    os.makedirs(master_folder, exist_ok=True)
-
-    for ticket in tickets:
-        sys_id = ticket.get("sys_id")
-        ticket_number = ticket.get("number", sys_id)
-
-        if not sys_id:
-            print("❌ Skipping ticket with missing sys_id")
-            continue
-
-        print(f"\n📥 Ticket: {ticket_number} (sys_id: {sys_id})")
-
-        base_dir = os.path.join(master_folder, ticket_number)
-        attachment_dir = os.path.join(base_dir, "Attachments")
-        pdf_dir = os.path.join(base_dir, "PDFs")
-
-        os.makedirs(attachment_dir, exist_ok=True)
-        os.makedirs(pdf_dir, exist_ok=True)
-
-        download_attachments_for_article(sys_id, attachment_dir, headers)
-        download_servicenow_pdf(sys_id, pdf_dir, headers)
+def download_all_attachments_and_pdfs(json_file, tickets=None, **options):
+    """Download every ticket's files; see snow_export.download_ticket_files for the options."""
+    if tickets is None:
+        with open(json_file, 'r') as f:
+            response_data = json.load(f)
+        tickets = response_data.get("result", [])
+    return download_ticket_files(PROFILE, tickets, **options)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Download all attachments and PDFs from ServiceNow tickets.')
-    parser.add_argument('json_path', type=str, help='Path to the response.json file')
+    parser.add_argument('json_path', type=str, nargs='?', help='Path to the response.json file')
+    parser.add_argument('--store', help='Take the tickets from this record store (Fetch_*_tickets --format sqlite) '
+                                        'instead of a JSON file, narrowed by the filters below')
+    parser.add_argument('--attachment-cache', default=ATTACHMENT_CACHE_DIR,
+                        help='Shared attachment blob store; repeat runs link cached files instead of downloading')
+    parser.add_argument('--attachment-workers', type=int, default=DEFAULT_ATTACHMENT_WORKERS,
+                        help='Concurrent attachment downloads')
+    parser.add_argument('--pdf-workers', type=int, default=DEFAULT_PDF_WORKERS,
+                        help='Concurrent PDF renders')
+    parser.add_argument('--backend', choices=['threads', 'async'], default='threads',
+                        help='threads: worker pools per stage; async: one event loop (needs httpx)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_ASYNC_CONCURRENCY,
+                        help='Requests in flight with --backend async')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='FOLDER',
+                        help='Continue an interrupted run (the newest one, or FOLDER), skipping files already saved')
+    add_query_arguments(parser)
     args = parser.parse_args()
-
-    token = get_bearer_token()
-    headers = {
-        'Authorization': f'Bearer {token}',
-    }
-
-    download_all_attachments_and_pdfs(args.json_path, headers)
+    if not args.json_path and not args.store:
+        parser.error("Give a response.json path or --store")
+
+    resume_folder = None
+    if args.resume:
+        resume_folder = latest_export_folder(PROFILE['folder_prefix'], 'tickets') if args.resume == 'latest' else args.resume
+        if not resume_folder or not os.path.exists(os.path.join(resume_folder, CHECKPOINT_FILE)):
+            parser.error("No interrupted run to resume")
+        if export_complete(resume_folder):
+            parser.error(f"{resume_folder} already finished; run without --resume to start a new run")
+
+    cache = AttachmentCache(args.attachment_cache) if args.attachment_cache else None
+    tickets = None
+    if args.store:
+        store = RecordStore(args.store)
+        tickets = list(query_from_args(store, TABLE, args))
+        store.close()
+    download_all_attachments_and_pdfs(args.json_path, cache=cache, attachment_workers=args.attachment_workers,
+                                      pdf_workers=args.pdf_workers, backend=args.backend,
+                                      concurrency=args.concurrency, resume_folder=resume_folder,
+                                      tickets=tickets)
@@ -0,0 +1,129 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from snow_async import DEFAULT_ASYNC_CONCURRENCY
+from snow_attachments import ATTACHMENT_CACHE_DIR, DEFAULT_ATTACHMENT_WORKERS, AttachmentCache
+from snow_checkpoint import latest_export_folder
+from snow_client import configure_pool
+from snow_columnar import iter_export_records
+from snow_export import DEFAULT_SHARDS, download_ticket_files, fetch_table, stored_sys_ids
+from snow_output import COMPRESSION_SUFFIXES
+from snow_pagination import DEFAULT_WORKERS, raw_value
+from snow_pipeline import DEFAULT_PDF_WORKERS
+from snow_store import RecordStore
+from table_profiles import profile_params, table_names, table_profile
+
+
+def exported_tickets(profile, result):
+    """Load the records a fetch_table run saved, wherever its format put them."""
+    if result['format'] == 'sqlite':
+        # Only this run's rows: the store keeps every earlier export of the table too
+        store = RecordStore(result['store'])
+        try:
+            return list(store.get_records(profile['table'], stored_sys_ids(result['folder'])))
+        finally:
+            store.close()
+    # Keyset and sharded walks yield a row again after a mid-export update; keep its later copy
+    latest = {}
+    for record in iter_export_records([result['folder']]):
+        latest[raw_value(record, 'sys_id')] = record
+    return list(latest.values())
+
+
+def export_table(profile, args, cache):
+    """Fetch one table and, with --files, its tickets' attachments and PDFs; returns a summary row."""
+    resume_folder = latest_export_folder(profile['folder_prefix'], 'fetch') if args.resume else None
+    params = profile_params(profile['table'], args.profile, display_value=args.display_value)
+    result = fetch_table(profile, batch_size=args.batch_size, max_workers=args.workers, mode=args.mode,
+                         output_format=args.format, compression=args.compress, params=params, backend=args.backend,
+                         concurrency=args.concurrency, resume_folder=resume_folder,
+                         store_path=args.store or profile['store'], shards=args.shards)
+    files = None
+    if args.files:
+        tickets = exported_tickets(profile, result)
+        files_resume = latest_export_folder(profile['folder_prefix'], 'tickets') if args.resume else None
+        files = download_ticket_files(profile, tickets, cache=cache, attachment_workers=args.attachment_workers,
+                                      pdf_workers=args.pdf_workers, backend=args.backend,
+                                      concurrency=args.concurrency, resume_folder=files_resume)
+    return result, files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Export several ServiceNow tables at once, sharing one connection pool, token and rate limiter')
+    parser.add_argument('tables', nargs='+', choices=table_names(), help='Tables to export (see table_profiles.TABLES)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Records per page (sysparm_limit)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Pages fetched concurrently per table')
+    parser.add_argument('--backend', choices=['threads', 'async'], default='threads',
+                        help='Offset mode and --files transport: thread pools, or asyncio (needs httpx)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_ASYNC_CONCURRENCY,
+                        help='Requests in flight per table with --backend async')
+    parser.add_argument('--mode', choices=['offset', 'keyset', 'sharded'], default='offset',
+                        help='offset: concurrent sysparm_offset pages (rows deleted mid-export can be skipped); '
+                             'keyset: continue from the last (sys_updated_on, sys_id); '
+                             'sharded: --workers keyset cursors over sys_created_on ranges')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                        help='sys_created_on ranges of about equal size for --mode sharded')
+    parser.add_argument('--format', choices=['json', 'ndjson', 'sqlite'], default='json',
+                        help='json: batch files plus a combined file; ndjson: stream one record per line; '
+                             'sqlite: upsert into each table\'s record store')
+    parser.add_argument('--compress', choices=[c for c in COMPRESSION_SUFFIXES if c], default=None,
+                        help='Compress the NDJSON streams')
+    parser.add_argument('--profile', default='full', help='Field profile applied to every table (see table_profiles.py)')
+    parser.add_argument('--display-value', choices=['true', 'false', 'all'], default=None,
+                        help="Override the profile's sysparm_display_value")
+    parser.add_argument('--store', help="Record store for --format sqlite (default: each table's <prefix>_store.db)")
+    parser.add_argument('--files', action='store_true',
+                        help='Also download every exported ticket\'s attachments and PDF, as the *_ticket_handling scripts do')
+    parser.add_argument('--attachment-cache', default=ATTACHMENT_CACHE_DIR,
+                        help='Shared attachment blob store; repeat runs link cached files instead of downloading')
+    parser.add_argument('--attachment-workers', type=int, default=DEFAULT_ATTACHMENT_WORKERS,
+                        help='Concurrent attachment downloads per table')
+    parser.add_argument('--pdf-workers', type=int, default=DEFAULT_PDF_WORKERS, help='Concurrent PDF renders per table')
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue each table's newest interrupted export with its original settings")
+    args = parser.parse_args()
+
+    if args.batch_size < 1 or args.workers < 1 or args.shards < 1:
+        parser.error("Batch size, workers and shards must be ≥1")
+    if args.compress and args.format != 'ndjson':
+        parser.error("--compress only applies to --format ndjson")
+    tables = list(dict.fromkeys(args.tables))
+    profiles = [table_profile(name) for name in tables]
+    for profile in profiles:
+        try:
+            profile_params(profile['table'], args.profile)
+        except ValueError as e:
+            parser.error(str(e))
+
+    start_time = time.time()
+    cache = AttachmentCache(args.attachment_cache) if args.attachment_cache else None
+    # Size the shared pool for every table's workers up front, so no table re-mounts it mid-run
+    per_table = args.workers + (args.attachment_workers + args.pdf_workers + 1 if args.files else 0)
+    configure_pool(per_table * len(profiles))
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(profiles), thread_name_prefix='table') as executor:
+        futures = {profile['name']: executor.submit(export_table, profile, args, cache) for profile in profiles}
+        summaries = []
+        for name, future in futures.items():
+            try:
+                summaries.append((name, *future.result()))
+            except (Exception, SystemExit) as e:
+                # fetch_table reports its own request errors and exits; the other tables carry on
+                print(f"❌ {name}: export failed ({e or 'see above'})")
+                failed.append(name)
+
+    minutes, seconds = divmod(time.time() - start_time, 60)
+    print("\n📊 Export summary")
+    for name, result, files in summaries:
+        line = f"   {name}: {result['records']} record(s) in {result['folder']}"
+        if files:
+            line += f", {files['attachments']} attachment(s) and {files['pdfs']} PDF(s)"
+        print(line)
+    for name in failed:
+        print(f"   {name}: failed")
+    print(f"⏱️ Total time taken: {int(minutes)} minutes, {int(seconds)} seconds")
+    if failed:
+        raise SystemExit(1)
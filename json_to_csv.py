@@ -1,32 +1,48 @@
-import json
-import csv
+import argparse
+import time
 
-# Load your JSON data from response.json
-with open('response.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+from snow_columnar import DEFAULT_ROW_GROUP_SIZE, convert_records, iter_export_records
+from snow_store import RecordStore, add_query_arguments, query_from_args
 
-rows = data['result']
+parser = argparse.ArgumentParser(
+    description='Convert a ServiceNow table export to a quoted CSV and/or a typed Parquet file')
+parser.add_argument('inputs', nargs='*', default=['response.json'],
+                    help='Table API responses, NDJSON streams, records_batch_*.json files or export folders '
+                         '(default: response.json)')
+parser.add_argument('--output', default='output',
+                    help='Output path without extension; .csv and/or .parquet is appended (default: output)')
+parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                    help='csv keeps every value as quoted text; parquet (needs pyarrow) stores typed columns')
+parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                    help='Rows held in memory and written per Parquet row group')
+parser.add_argument('--store', help='Read records from this record store instead, narrowed by the filters below')
+parser.add_argument('--table', help='Table to read from --store (e.g. sn_hr_core_case)')
+add_query_arguments(parser)
+args = parser.parse_args()
+if args.store and not args.table:
+    parser.error("--store needs --table")
+if args.row_group_size < 1:
+    parser.error("--row-group-size must be at least 1")
 
-# Collect all headers in the order of the first object
-headers = list(rows[0].keys())
+start_time = time.time()
+store = RecordStore(args.store) if args.store else None
+if store:
+    open_records = lambda: query_from_args(store, args.table, args)
+else:
+    open_records = lambda: iter_export_records(args.inputs)
 
-# Prepare rows: extract display_value from nested dicts (like closed_by)
-processed_rows = []
-for row in rows:
-    processed_row = {}
-    for key in headers:
-        if key in row:
-            if isinstance(row[key], dict) and 'display_value' in row[key]:
-                processed_row[key] = row[key]['display_value']
-            else:
-                processed_row[key] = row[key]
-        else:
-            processed_row[key] = None
-    processed_rows.append(processed_row)
+csv_path = f"{args.output}.csv" if args.format in ('csv', 'both') else None
+parquet_path = f"{args.output}.parquet" if args.format in ('parquet', 'both') else None
+try:
+    rows, schema = convert_records(open_records, csv_path, parquet_path, args.row_group_size)
+finally:
+    if store:
+        store.close()
 
-# Write quoted CSV
-with open('output.csv', 'w', encoding='utf-8', newline='') as f:
-    writer = csv.writer(f, quoting=csv.QUOTE_ALL)
-    writer.writerow(headers)
-    for row in processed_rows:
-        writer.writerow([str(row.get(key, '')) for key in headers])
+if not rows:
+    print("❌ No records to convert")
+    raise SystemExit(1)
+for path in (csv_path, parquet_path):
+    if path:
+        print(f"✅ Wrote {rows} rows x {len(schema.columns)} columns to {path}")
+print(f"⏱️ Converted in {time.time() - start_time:.1f}s")
@@ -1,24 +1,31 @@
-import requests
 import json
 from bs4 import BeautifulSoup, NavigableString, Tag
 from datetime import datetime
 import re
 import os
 import argparse
+import asyncio
 from docx import Document
 from io import BytesIO
 from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from dotenv import load_dotenv
-from urllib.parse import urlencode
 import html2text
 import html
 from html import unescape
 from html2docx import html2docx
 import base64
 
+import snow_async
+from snow_attachments import download_attachments_for_article
+from snow_client import get_session, snow_url
+from snow_images import CONFLUENCE_IMAGE_WIDTH, DEFAULT_IMAGE_DPI, optimize_images
+from table_profiles import profile_params
+
 load_dotenv()
 
+session = get_session()
+
  
 
 def replace_img_with_confluence_macro(html_content, attachments):
@@ -110,25 +117,6 @@ def clean_inline_spans(html_content):
 
     return text
 
-def get_bearer_token():
-    url = "https://lendlease.service-now.com/oauth_token.do"
-    payload_dict = {
-        'grant_type': 'password',
-        'username': os.getenv('SNOW_USERNAME'),
-        'password': os.getenv('SNOW_PASSWORD'),
-        'client_id': os.getenv('SNOW_CLIENT_ID'),
-        'client_secret': os.getenv('SNOW_CLIENT_SECRET')
-    }
-    payload = urlencode(payload_dict)
-
-    headers = {
-    'Content-Type': 'application/x-www-form-urlencoded',
-    }
-    response = requests.post(url, data=payload, headers=headers)
-    print(f"Response Status Code: {response.status_code}")
-    data = response.json()
-    return data['access_token']
-
 def clean_html_text(html_content):
     """Convert HTML to clean, linear text without unnecessary line breaks from inline tags like <span>."""
     if not html_content:
@@ -149,81 +137,6 @@ def clean_html_text(html_content):
     return text
 
 
-def download_attachments_for_article(table_sys_id, output_dir, headers):
-    """Download attachments for a specific KB article and save them in its folder,
-    refresh token if 401 Unauthorized is received."""
-
-    attachment_url = f"https://lendlease.service-now.com/api/now/attachment?sysparm_query=table_sys_id={table_sys_id}"
-
-    def try_download(headers):
-        try:
-            response = requests.get(attachment_url, headers=headers)
-            if response.status_code == 401:
-                return 'unauthorized', None
-            elif response.status_code != 200:
-                print(f"❌ Failed to get attachment list for {table_sys_id}. Status code: {response.status_code}")
-                return 'failed', None
-            
-            data = response.json()
-            attachments = data.get('result', [])
-            if not attachments:
-                print(f"📎 No attachments found for {table_sys_id}")
-                return 'empty', None
-            
-            print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
-            return 'success', attachments
-        except Exception as e:
-            print(f"❌ Exception while fetching attachments: {e}")
-            return 'error', None
-
-    status, attachments = try_download(headers)
-
-    if status == 'unauthorized':
-        print("🔄 Access token expired, refreshing token...")
-        # Refresh token here and update headers
-        new_token = get_bearer_token()
-        headers['Authorization'] = f'Bearer {new_token}'
-        # Retry once with new token
-        status, attachments = try_download(headers)
-        if status == 'unauthorized':
-            print("❌ Token refresh failed or new token also unauthorized.")
-            return []
-        elif status != 'success':
-            return []
-
-    if status != 'success':
-        return []
-
-    downloaded_attachments = []
-    # Download each attachment
-    for attachment in attachments:
-        file_name = attachment.get('file_name')
-        sys_id = attachment.get('sys_id')
-        file_name = f"{sys_id}_{file_name}" if file_name else f"{table_sys_id}_attachment"
-        download_link = attachment.get('download_link')
-        file_size = attachment.get('size_bytes')
-
-        if download_link and file_name:
-            try:
-                file_response = requests.get(download_link, headers=headers)
-                if file_response.status_code == 200:
-                    file_path = os.path.join(output_dir, file_name)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_response.content)
-                    print(f"   ✓ Downloaded: {file_name} ({file_size} bytes)")
-                    downloaded_attachments.append({
-                        'file_name': file_name,
-                        'file_path': file_path,
-                        'sys_id': sys_id,
-                        'size_bytes': file_size
-                    })
-                else:
-                    print(f"   ✗ Failed to download {file_name} (Status {file_response.status_code})")
-            except Exception as e:
-                print(f"   ✗ Error downloading {file_name}: {e}")
-    
-    return downloaded_attachments
-
 def add_html_with_images(doc, html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -291,7 +204,7 @@ def upload_attachment_to_confluence(confluence_url, username, api_token, page_id
             'file': (file_name, f, 'application/octet-stream')
         }
         
-        response = requests.post(
+        response = session.post(
             url,
             headers=headers,
             files=files,
@@ -305,6 +218,31 @@ def upload_attachment_to_confluence(confluence_url, username, api_token, page_id
         print(f"❌ Failed to upload attachment {file_name}: {response.status_code} - {response.text}")
         return None
 
+async def upload_attachments_to_confluence_async(confluence_url, username, api_token, page_id, attachments):
+    """Upload all attachments to a Confluence page concurrently; returns the uploaded attachment for each (or None)"""
+    url = f"{confluence_url}/rest/api/content/{page_id}/child/attachment"
+
+    async def upload(client, attachment):
+        with open(attachment['file_path'], 'rb') as f:
+            files = {'file': (attachment['file_name'], f.read(), 'application/octet-stream')}
+        print(f"📎 Uploading attachment: {attachment['file_name']}")
+        try:
+            response = await client.request('POST', url, headers={'X-Atlassian-Token': 'no-check'}, files=files,
+                                            auth=(username, api_token))
+        except Exception as e:
+            # One failed upload must not abandon the rest of the page's attachments
+            print(f"❌ Failed to upload attachment {attachment['file_name']}: {e}")
+            return None
+        if response.status_code == 200:
+            print(f"   ✅ Attachment uploaded successfully: {attachment['file_name']}")
+            attachment_data = response.json()
+            return attachment_data['results'][0] if attachment_data.get('results') else None
+        print(f"❌ Failed to upload attachment {attachment['file_name']}: {response.status_code} - {response.text}")
+        return None
+
+    async with snow_async.AsyncSnowClient() as client:
+        return await asyncio.gather(*(upload(client, attachment) for attachment in attachments))
+
 def create_confluence_content(article, attachments):
     """Generate Confluence storage format content from KB article JSON"""
     
@@ -429,7 +367,7 @@ def create_or_update_confluence_page(confluence_url, username, api_token, space_
         'expand': 'version'
     }
     
-    response = requests.get(search_url, params=search_params, auth=(username, api_token))
+    response = session.get(search_url, params=search_params, auth=(username, api_token))
     
     if response.status_code != 200:
         print(f"❌ Failed to search for existing page: {response.status_code}")
@@ -461,7 +399,7 @@ def create_or_update_confluence_page(confluence_url, username, api_token, space_
         }
         
         update_url = f"{confluence_url}/rest/api/content/{page_id}"
-        response = requests.put(
+        response = session.put(
             update_url,
             json=update_data,
             headers={'Content-Type': 'application/json'},
@@ -492,7 +430,7 @@ def create_or_update_confluence_page(confluence_url, username, api_token, space_
         }
         
         create_url = f"{confluence_url}/rest/api/content"
-        response = requests.post(
+        response = session.post(
             create_url,
             json=create_data,
             headers={'Content-Type': 'application/json'},
@@ -509,6 +447,12 @@ def create_or_update_confluence_page(confluence_url, username, api_token, space_
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description='Download and export a specific KB article from ServiceNow to DOCX and Confluence')
 parser.add_argument('article_number', type=str, help='KB article number (e.g., KB0020129)')
+parser.add_argument('--backend', choices=['threads', 'async'], default='threads',
+                    help='async: download and upload attachments concurrently on one event loop (needs httpx)')
+parser.add_argument('--optimize-images', action='store_true',
+                    help='Upload image attachments scaled down to the page width and recompressed')
+parser.add_argument('--image-dpi', type=int, default=DEFAULT_IMAGE_DPI,
+                    help='Resolution the page width is converted to pixels at, with --optimize-images')
 args = parser.parse_args()
 
 article_number = args.article_number
@@ -520,16 +464,9 @@ confluence_token = os.getenv('CONFLUENCE_TOKEN')
 confluence_space = os.getenv('CONFLUENCE_SPACE')
 
 # Updated API call to get only one article by number
-url = f"https://lendlease.service-now.com/api/now/table/kb_knowledge?sysparm_query=number={article_number}&sysparm_display_value=true"
-
-payload = {}
+url = snow_url(f"api/now/table/kb_knowledge?sysparm_query=number={article_number}")
 
-token = get_bearer_token()
-headers = {
-  'Authorization': f'Bearer {token}',
-  'Cookie': 'BIGipServerpool_lendlease=c5889ad29f701618e3baa37002034b82; JSESSIONID=3901AC59B602B51CE1CF74C8956FD362; glide_node_id_for_js=fc4812175032dd94c0ff92cf846b17cf27f0dce0a6beb49e12e5c7bb0f48d836; glide_session_store=6360D6592B3D6E50E412F41CD891BF5D; glide_user_activity=U0N2M18xOnRMdkppdFlTN2o2cFlnUVdaQ082UjZ6S0pFdXV0dmZBb3BMcGxVa0hrZ1E9OlVBQWc4QWozUERYQi9mVCs2WDRJa0hTRTgwQjkxMGZkMzUrNGxlUXRNUW89; glide_user_route=glide.5a07cc0a1b859ed021434a69d48daaeb'
-}
-response = requests.get(url, headers=headers)
+response = session.get(url, params=profile_params('kb_knowledge', 'docx'))
 
 if response.status_code != 200:
     print(f"❌ Failed to fetch article {article_number}. Status code: {response.status_code}")
@@ -549,8 +486,18 @@ output_dir = os.path.join(parent_dir, article_number)
 os.makedirs(output_dir, exist_ok=True)
 
 # Download attachments
-downloaded_attachments = download_attachments_for_article(article['sys_id'], output_dir, headers)
+if args.backend == 'async':
+    downloaded_attachments = snow_async.download_all_attachments({article['sys_id']: output_dir})[article['sys_id']]
+else:
+    downloaded_attachments = download_attachments_for_article(article['sys_id'], output_dir)
 
+if args.optimize_images:
+    # Upload the optimized copies under the original file names, which the page's image macros refer to;
+    # keep_format leaves BMP/GIF/TIFF/HEIC files as they are rather than sending PNG bytes under those names
+    optimized = optimize_images([(a['file_path'], CONFLUENCE_IMAGE_WIDTH) for a in downloaded_attachments],
+                                dpi=args.image_dpi, keep_format=True)
+    downloaded_attachments = [dict(a, file_path=optimized.get((a['file_path'], CONFLUENCE_IMAGE_WIDTH), a['file_path']))
+                              for a in downloaded_attachments]
 
 # Upload to Confluence if parameters are available in environment
 if confluence_url and confluence_username and confluence_token and confluence_space:
@@ -570,20 +517,29 @@ if confluence_url and confluence_username and confluence_token and confluence_sp
         page_id = confluence_page['id']
         
         # Upload attachments to Confluence
-        for attachment in downloaded_attachments:
-            print(f"📎 Uploading attachment: {attachment['file_name']}")
-            uploaded = upload_attachment_to_confluence(
+        if args.backend == 'async':
+            asyncio.run(upload_attachments_to_confluence_async(
                 confluence_url,
                 confluence_username,
                 confluence_token,
                 page_id,
-                attachment['file_path'],
-                attachment['file_name']
-            )
-            if uploaded:
-                print(f"   ✅ Attachment uploaded successfully")
-            else:
-                print(f"   ❌ Failed to upload attachment")
+                downloaded_attachments
+            ))
+        else:
+            for attachment in downloaded_attachments:
+                print(f"📎 Uploading attachment: {attachment['file_name']}")
+                uploaded = upload_attachment_to_confluence(
+                    confluence_url,
+                    confluence_username,
+                    confluence_token,
+                    page_id,
+                    attachment['file_path'],
+                    attachment['file_name']
+                )
+                if uploaded:
+                    print(f"   ✅ Attachment uploaded successfully")
+                else:
+                    print(f"   ❌ Failed to upload attachment")
         
         page_url = f"{confluence_url}/pages/viewpage.action?pageId={page_id}"
         print(f"✅ Confluence page available at: {page_url}")
@@ -0,0 +1,397 @@
+import asyncio
+import os
+import queue
+import threading
+import uuid
+import weakref
+from urllib.parse import urlparse
+
+import requests
+
+from snow_attachments import PREFETCH_CHUNK_SIZE, PREFETCH_PAGE_SIZE, default_cache
+from snow_client import DOWNLOAD_CHUNK_SIZE, TOKEN_PATH, _is_instance_url, aget_bearer_token, snow_url
+from snow_pagination import DEFAULT_PAGE_SIZE, raw_value, with_stable_order
+from snow_ratelimit import IDEMPOTENT_METHODS, MAX_RETRIES, _slot_releaser, backoff_delay, limiter_for, retry_delay
+
+# Requests in flight on one event loop; each costs a socket, not a thread
+DEFAULT_ASYNC_CONCURRENCY = int(os.getenv('SNOW_ASYNC_CONCURRENCY', '64'))
+
+
+def _import_httpx():
+    try:
+        import httpx
+    except ImportError:
+        print("❌ The async backend needs the 'httpx' package (pip install httpx)")
+        raise SystemExit(1)
+    return httpx
+
+
+class AsyncSnowClient:
+    """Asyncio transport for ServiceNow (and Confluence) calls on one event loop.
+
+    Wraps a single httpx.AsyncClient whose connection pool and an in-flight
+    semaphore are both sized to concurrency. Instance requests carry the
+    shared bearer token and are retried once after a 401, like BearerAuth
+    does for the blocking session; other hosts are called as given.
+    """
+
+    def __init__(self, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        httpx = self._httpx = _import_httpx()
+        self.concurrency = concurrency
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self._client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(120.0, connect=30.0),
+                                         follow_redirects=True)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._blob_locks = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _send(self, method, url, stream=False, **kwargs):
+        headers = dict(kwargs.pop('headers', None) or {})
+        # httpx takes auth when sending, not when building the request
+        auth = kwargs.pop('auth', None)
+        authenticate = _is_instance_url(url) and urlparse(url).path != TOKEN_PATH
+        rejected = None
+        while True:
+            if authenticate:
+                token = await aget_bearer_token(force_refresh=rejected is not None, rejected=rejected)
+                headers['Authorization'] = f'Bearer {token}'
+            request = self._client.build_request(method, url, headers=headers, **kwargs)
+            response = await self._send_limited(request, stream, auth)
+            if response.status_code != 401 or not authenticate or rejected is not None:
+                return response
+            await response.aclose()
+            rejected = token
+
+    async def _send_limited(self, request, stream, auth=None):
+        # Same limiter and retry policy as RateLimitedAdapter, shared with the blocking session
+        limiter = limiter_for(str(request.url))
+        attempt = 0
+        while True:
+            await limiter.aacquire()
+            try:
+                response = await self._client.send(request, stream=stream, auth=auth)
+            except self._httpx.TransportError as e:
+                limiter.release()
+                if attempt >= MAX_RETRIES or request.method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"⚠️ {type(e).__name__} on {request.url.path}; retrying in {delay:.1f}s")
+            else:
+                limiter.record(response.status_code, response.headers)
+                delay = retry_delay(request.method, response.status_code, response.headers, attempt)
+                if delay is None:
+                    if stream:
+                        self._hold_slot_until_closed(response, limiter)
+                    else:
+                        limiter.release()
+                    return response
+                limiter.release()
+                await response.aclose()
+                print(f"⏳ {response.status_code} on {request.url.path}; retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{MAX_RETRIES})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _hold_slot_until_closed(response, limiter):
+        # Streamed downloads keep their limiter slot until the body is closed, like RateLimitedAdapter
+        release = _slot_releaser(limiter)
+        aclose = response.aclose
+
+        async def aclose_and_release():
+            try:
+                await aclose()
+            finally:
+                release()
+
+        response.aclose = aclose_and_release
+        weakref.finalize(response, release)
+
+    async def request(self, method, url, **kwargs):
+        """Send a request and return the httpx response with its body loaded."""
+        async with self._slots:
+            return await self._send(method, url, **kwargs)
+
+    async def fetch_page(self, table, params, limit, offset):
+        page_params = dict(params, sysparm_limit=limit, sysparm_offset=offset)
+        response = await self.request('GET', snow_url(f"api/now/table/{table}"), params=page_params)
+        response.raise_for_status()
+        return response.json().get('result', [])
+
+    async def total_count(self, table, query=''):
+        response = await self.request('GET', snow_url(f"api/now/stats/{table}"),
+                                      params={'sysparm_count': 'true', 'sysparm_query': query})
+        if response.status_code == 200:
+            return int(response.json()['result']['stats']['count'])
+        response = await self.request('GET', snow_url(f"api/now/table/{table}"),
+                                      params={'sysparm_query': query, 'sysparm_fields': 'sys_id', 'sysparm_limit': 1})
+        response.raise_for_status()
+        return int(response.headers['X-Total-Count'])
+
+    async def iter_offset_pages(self, table, params=None, page_size=DEFAULT_PAGE_SIZE, total=None, skip_pages=()):
+        """Async counterpart of snow_pagination.iter_offset_pages, with up to concurrency pages in flight.
+
+        Like it, rows deleted during the walk shift later offsets and can make
+        it skip rows; use keyset mode when coverage must be exact.
+        """
+        params = dict(params or {})
+        params['sysparm_query'] = with_stable_order(params.get('sysparm_query', ''))
+        if total is None:
+            total = await self.total_count(table, params['sysparm_query'])
+        page_count = -(-total // page_size)
+        print(f"📊 {table}: {total} record(s) in {page_count} page(s) of {page_size}")
+
+        seen = set()
+
+        def unique(records):
+            fresh = []
+            for record in records:
+                sys_id = raw_value(record, 'sys_id')
+                if sys_id not in seen:
+                    seen.add(sys_id)
+                    fresh.append(record)
+            return fresh
+
+        tasks = {}
+        next_submit = 0
+        last_count = 0
+        try:
+            for page in range(page_count):
+                while next_submit < page_count and next_submit < page + self.concurrency:
+                    if next_submit + 1 not in skip_pages:
+                        tasks[next_submit] = asyncio.ensure_future(
+                            self.fetch_page(table, params, page_size, next_submit * page_size))
+                    next_submit += 1
+                if page + 1 in skip_pages:
+                    last_count = page_size
+                    continue
+                records = await tasks.pop(page)
+                last_count = len(records)
+                if last_count < page_size and page < page_count - 1:
+                    print(f"⚠️ Page {page + 1} returned {last_count} of {page_size} rows; rows were removed during the "
+                          f"export and later rows may have been skipped (use keyset mode for exact coverage)")
+                yield page + 1, unique(records)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        # The table grew while we were reading: keep going until a short page
+        page = page_count
+        while last_count == page_size or (page_count == 0 and page == 0):
+            if page + 1 in skip_pages:
+                page += 1
+                continue
+            records = await self.fetch_page(table, params, page_size, page * page_size)
+            last_count = len(records)
+            if not records:
+                break
+            page += 1
+            yield page, unique(records)
+
+        if len(seen) < total and not skip_pages:
+            print(f"⚠️ Exported {len(seen)} unique record(s); {total} matched when the export started. Rows deleted "
+                  f"during the export shift later offsets, so some remaining rows may have been skipped; "
+                  f"use keyset mode for exact coverage")
+        elif len(seen) != total and not skip_pages:
+            print(f"ℹ️ Exported {len(seen)} unique record(s); {total} matched when the export started")
+
+    async def list_attachments(self, table_sys_id):
+        response = await self.request('GET', snow_url("api/now/attachment"),
+                                      params={'sysparm_query': f"table_sys_id={table_sys_id}"})
+        if response.status_code != 200:
+            print(f"❌ Failed to get attachment list for {table_sys_id}. Status code: {response.status_code}")
+            return None
+        return response.json().get('result', [])
+
+    async def _list_attachments_chunk(self, table_sys_ids):
+        query = f"table_sys_idIN{','.join(table_sys_ids)}^ORDERBYsys_id"
+        found = []
+        offset = 0
+        while True:
+            params = {'sysparm_query': query, 'sysparm_limit': PREFETCH_PAGE_SIZE, 'sysparm_offset': offset}
+            response = await self.request('GET', snow_url("api/now/attachment"), params=params)
+            response.raise_for_status()
+            page = response.json().get('result', [])
+            found.extend(page)
+            if len(page) < PREFETCH_PAGE_SIZE:
+                return found
+            offset += PREFETCH_PAGE_SIZE
+
+    async def prefetch_attachment_index(self, table_sys_ids, chunk_size=PREFETCH_CHUNK_SIZE):
+        """Async counterpart of snow_attachments.prefetch_attachment_index."""
+        table_sys_ids = [sys_id for sys_id in dict.fromkeys(table_sys_ids) if sys_id]
+        chunks = [table_sys_ids[i:i + chunk_size] for i in range(0, len(table_sys_ids), chunk_size)]
+        results = await asyncio.gather(*(self._list_attachments_chunk(chunk) for chunk in chunks),
+                                       return_exceptions=True)
+        index = {}
+        for chunk, attachments in zip(chunks, results):
+            if isinstance(attachments, Exception):
+                print(f"❌ Failed to prefetch attachments for {len(chunk)} record(s): {attachments}")
+                continue
+            for sys_id in chunk:
+                index[sys_id] = []
+            for attachment in attachments:
+                index.setdefault(attachment.get('table_sys_id'), []).append(attachment)
+        return index
+
+    async def download_to_file(self, url, file_path, expected_size=None, params=None):
+        """Async counterpart of snow_client.download_to_file; returns the closed httpx response."""
+        async with self._slots:
+            response = await self._send('GET', url, stream=True, params=params)
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    return response
+
+                folder = os.path.dirname(file_path) or '.'
+                tmp_path = os.path.join(folder, f".{os.path.basename(file_path)}.{uuid.uuid4().hex[:8]}.part")
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                try:
+                    written = 0
+                    with os.fdopen(fd, 'wb') as f:
+                        async for chunk in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            written += len(chunk)
+                    if expected_size is not None and written != int(expected_size):
+                        raise IOError(f"expected {expected_size} bytes but received {written}")
+                    os.replace(tmp_path, file_path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+            finally:
+                await response.aclose()
+        return response
+
+    async def _fetch_blob(self, cache, attachment):
+        path = cache.blob_path(attachment)
+        lock = self._blob_locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            if not cache.has(attachment):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                response = await self.download_to_file(attachment['download_link'], path,
+                                                       expected_size=attachment.get('size_bytes'))
+                if response.status_code != 200:
+                    return None
+        return path
+
+    async def download_attachment(self, attachment, output_dir, table_sys_id, cache=None):
+        """Async counterpart of snow_attachments.download_attachment."""
+        sys_id = attachment.get('sys_id')
+        file_name = attachment.get('file_name')
+        file_name = f"{sys_id}_{file_name}" if file_name else f"{table_sys_id}_attachment"
+        download_link = attachment.get('download_link')
+        file_size = attachment.get('size_bytes')
+        if not download_link:
+            return None
+
+        file_path = os.path.join(output_dir, file_name)
+        try:
+            if cache:
+                cached = cache.has(attachment)
+                blob_path = cache.blob_path(attachment) if cached else await self._fetch_blob(cache, attachment)
+                if blob_path is None:
+                    print(f"   ✗ Failed to download {file_name}")
+                    return None
+                cache.link(blob_path, file_path)
+                print(f"   {'♻️ Reused cached' if cached else '✓ Downloaded'}: {file_name} ({file_size} bytes)")
+            else:
+                response = await self.download_to_file(download_link, file_path, expected_size=file_size)
+                if response.status_code != 200:
+                    print(f"   ✗ Failed to download {file_name} (Status {response.status_code})")
+                    return None
+                print(f"   ✓ Downloaded: {file_name} ({file_size} bytes)")
+        except Exception as e:
+            print(f"   ✗ Error downloading {file_name}: {e}")
+            return None
+        return {'file_name': file_name, 'file_path': file_path, 'sys_id': sys_id, 'size_bytes': file_size}
+
+    async def download_attachments(self, table_sys_id, output_dir, attachments=None, cache=None):
+        """Async counterpart of snow_attachments.download_attachments_for_article."""
+        if attachments is None:
+            attachments = await self.list_attachments(table_sys_id)
+        if not attachments:
+            return []
+        print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
+        results = await asyncio.gather(*(self.download_attachment(attachment, output_dir, table_sys_id, cache)
+                                         for attachment in attachments))
+        return [result for result in results if result]
+
+
+async def _download_all_attachments(output_dirs, concurrency, cache):
+    async with AsyncSnowClient(concurrency) as client:
+        index = await client.prefetch_attachment_index(output_dirs)
+        downloads = await asyncio.gather(*(client.download_attachments(sys_id, output_dir,
+                                                                       attachments=index.get(sys_id), cache=cache)
+                                           for sys_id, output_dir in output_dirs.items()))
+        return dict(zip(output_dirs, downloads))
+
+
+def download_all_attachments(output_dirs, concurrency=DEFAULT_ASYNC_CONCURRENCY, cache=None):
+    """Blocking wrapper: download the attachments of every {table_sys_id: output_dir} on one event loop.
+
+    Returns {table_sys_id: [downloaded file dicts]}, as
+    download_attachments_for_article would for each record.
+    """
+    return asyncio.run(_download_all_attachments(output_dirs, concurrency, cache or default_cache()))
+
+
+def iter_offset_pages(table, params=None, page_size=DEFAULT_PAGE_SIZE, concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                      total=None, skip_pages=()):
+    """Blocking wrapper yielding the same (page_number, records) as snow_pagination.iter_offset_pages.
+
+    The pages are fetched by an event loop on a background thread and handed
+    over through a small bounded queue, so callers keep writing pages
+    sequentially while many requests are in flight.
+    """
+    httpx = _import_httpx()
+    pages = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    done = object()
+
+    async def produce():
+        async with AsyncSnowClient(concurrency) as client:
+            loop = asyncio.get_running_loop()
+            async for item in client.iter_offset_pages(table, params, page_size=page_size, total=total,
+                                                     skip_pages=skip_pages):
+                # Wait for room off the loop so in-flight requests keep progressing
+                await loop.run_in_executor(None, pages.put, item)
+                if stop.is_set():
+                    return
+
+    def run():
+        try:
+            asyncio.run(produce())
+            pages.put(done)
+        except httpx.HTTPError as e:
+            # Callers of the blocking API handle requests' exceptions
+            pages.put(requests.exceptions.RequestException(str(e)))
+        except BaseException as e:
+            pages.put(e)
+
+    thread = threading.Thread(target=run, name=f"async-pages-{table}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue so the thread can exit
+        while thread.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
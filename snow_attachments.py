@@ -0,0 +1,243 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from snow_client import configure_pool, download_to_file, get_session, snow_url
+
+DEFAULT_ATTACHMENT_WORKERS = int(os.getenv('SNOW_ATTACHMENT_WORKERS', '4'))
+# Upper bound on simultaneous downloads from one host, across every pool in the process
+PER_HOST_LIMIT = int(os.getenv('SNOW_PER_HOST_LIMIT', '8'))
+# Records per table_sys_idIN query when prefetching attachment metadata
+PREFETCH_CHUNK_SIZE = 100
+PREFETCH_PAGE_SIZE = 1000
+
+# Shared blob store for attachments; unset disables caching
+ATTACHMENT_CACHE_DIR = os.getenv('SNOW_ATTACHMENT_CACHE')
+FICLONE = 0x40049409  # Linux ioctl that reflinks a file on btrfs/xfs
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def host_slot(url):
+    """Return the semaphore limiting concurrent downloads from url's host."""
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_slots[host]
+
+
+class AttachmentCache:
+    """Content-addressed blob store shared by every ticket and article folder.
+
+    Blobs are keyed by the attachment's content hash when ServiceNow provides
+    one, so the same logo attached to hundreds of records is stored and
+    downloaded once; otherwise by sys_id plus sys_updated_on. Per-record
+    folders get a hardlink (or reflink, or copy across filesystems) to the
+    blob, so files in those folders must be treated as read-only.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def blob_path(self, attachment):
+        content_hash = attachment.get('hash')
+        if content_hash:
+            key = f"sha256-{content_hash}"
+        else:
+            version = f"{attachment.get('sys_id')}:{attachment.get('sys_updated_on')}"
+            key = f"id-{hashlib.sha256(version.encode()).hexdigest()}"
+        return os.path.join(self.root, key[:9], key)
+
+    def has(self, attachment):
+        path = self.blob_path(attachment)
+        if not os.path.exists(path):
+            return False
+        expected = attachment.get('size_bytes')
+        return expected is None or os.path.getsize(path) == int(expected)
+
+    def fetch(self, attachment):
+        """Download the attachment into the store unless it is already there; returns the blob path."""
+        path = self.blob_path(attachment)
+        with self._locks_lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        # Records sharing a blob wait for the first download instead of fetching it again
+        with lock:
+            if not self.has(attachment):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                response = download_to_file(attachment['download_link'], path,
+                                            expected_size=attachment.get('size_bytes'))
+                if response.status_code != 200:
+                    return None
+        return path
+
+    @staticmethod
+    def link(blob_path, file_path):
+        if os.path.exists(file_path) and os.path.samefile(blob_path, file_path):
+            return
+        tmp_path = f"{file_path}.link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            try:
+                with open(blob_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                    raise
+                shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, file_path)
+
+
+def default_cache():
+    return AttachmentCache(ATTACHMENT_CACHE_DIR) if ATTACHMENT_CACHE_DIR else None
+
+
+def list_attachments(table_sys_id):
+    """Return the attachment metadata for a record, or None if the listing failed."""
+    attachment_url = snow_url("api/now/attachment")
+    params = {'sysparm_query': f"table_sys_id={table_sys_id}"}
+
+    try:
+        response = get_session().get(attachment_url, params=params)
+        if response.status_code != 200:
+            print(f"❌ Failed to get attachment list for {table_sys_id}. Status code: {response.status_code}")
+            return None
+
+        attachments = response.json().get('result', [])
+        if not attachments:
+            print(f"📎 No attachments found for {table_sys_id}")
+        else:
+            print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
+        return attachments
+    except Exception as e:
+        print(f"❌ Exception while fetching attachments: {e}")
+        return None
+
+
+def _list_attachments_chunk(table_sys_ids):
+    attachment_url = snow_url("api/now/attachment")
+    query = f"table_sys_idIN{','.join(table_sys_ids)}^ORDERBYsys_id"
+    found = []
+    offset = 0
+    while True:
+        params = {'sysparm_query': query, 'sysparm_limit': PREFETCH_PAGE_SIZE, 'sysparm_offset': offset}
+        response = get_session().get(attachment_url, params=params)
+        response.raise_for_status()
+        page = response.json().get('result', [])
+        found.extend(page)
+        if len(page) < PREFETCH_PAGE_SIZE:
+            return found
+        offset += PREFETCH_PAGE_SIZE
+
+
+def prefetch_attachment_index(table_sys_ids, chunk_size=PREFETCH_CHUNK_SIZE, max_workers=DEFAULT_ATTACHMENT_WORKERS):
+    """Build a table_sys_id -> [attachment metadata] index with one query per chunk of records.
+
+    Every record of a chunk that was listed successfully appears in the index,
+    with an empty list when it has no attachments. Records from failed chunks
+    are left out so callers fall back to listing them one by one.
+    """
+    table_sys_ids = [sys_id for sys_id in dict.fromkeys(table_sys_ids) if sys_id]
+    chunks = [table_sys_ids[i:i + chunk_size] for i in range(0, len(table_sys_ids), chunk_size)]
+    index = {}
+
+    def list_chunk(chunk):
+        try:
+            return chunk, _list_attachments_chunk(chunk)
+        except Exception as e:
+            print(f"❌ Failed to prefetch attachments for {len(chunk)} record(s): {e}")
+            return chunk, None
+
+    configure_pool(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk, attachments in executor.map(list_chunk, chunks):
+            if attachments is None:
+                continue
+            for sys_id in chunk:
+                index[sys_id] = []
+            for attachment in attachments:
+                index.setdefault(attachment.get('table_sys_id'), []).append(attachment)
+
+    total = sum(len(attachments) for attachments in index.values())
+    print(f"📎 Prefetched {total} attachment(s) for {len(index)} record(s) in {len(chunks)} request(s)")
+    return index
+
+
+def download_attachment(attachment, output_dir, table_sys_id, cache=None):
+    """Download one attachment into output_dir as <sys_id>_<file_name>, via the cache if given."""
+    file_name = attachment.get('file_name')
+    sys_id = attachment.get('sys_id')
+    file_name = f"{sys_id}_{file_name}" if file_name else f"{table_sys_id}_attachment"
+    download_link = attachment.get('download_link')
+    file_size = attachment.get('size_bytes')
+
+    if not download_link:
+        return None
+
+    file_path = os.path.join(output_dir, file_name)
+    downloaded = {
+        'file_name': file_name,
+        'file_path': file_path,
+        'sys_id': sys_id,
+        'size_bytes': file_size
+    }
+    try:
+        if cache:
+            cached = cache.has(attachment)
+            if cached:
+                blob_path = cache.blob_path(attachment)
+            else:
+                with host_slot(download_link):
+                    blob_path = cache.fetch(attachment)
+                if blob_path is None:
+                    print(f"   ✗ Failed to download {file_name}")
+                    return None
+            cache.link(blob_path, file_path)
+            print(f"   {'♻️ Reused cached' if cached else '✓ Downloaded'}: {file_name} ({file_size} bytes)")
+            return downloaded
+
+        with host_slot(download_link):
+            file_response = download_to_file(download_link, file_path, expected_size=file_size)
+        if file_response.status_code == 200:
+            print(f"   ✓ Downloaded: {file_name} ({file_size} bytes)")
+            return downloaded
+        print(f"   ✗ Failed to download {file_name} (Status {file_response.status_code})")
+    except Exception as e:
+        print(f"   ✗ Error downloading {file_name}: {e}")
+    return None
+
+
+def download_attachments_for_article(table_sys_id, output_dir, max_workers=DEFAULT_ATTACHMENT_WORKERS, cache=None,
+                                     attachments=None):
+    """Download every attachment of a ticket or KB article into output_dir.
+
+    Files are fetched concurrently by a bounded thread pool. Returns a list
+    of dicts (file_name, file_path, sys_id, size_bytes) for the files saved.
+    cache defaults to the SNOW_ATTACHMENT_CACHE blob store, if configured.
+    attachments skips the listing call when the metadata was prefetched.
+    """
+    if attachments is None:
+        attachments = list_attachments(table_sys_id)
+    elif attachments:
+        print(f"📎 Found {len(attachments)} attachment(s) for {table_sys_id}")
+    if not attachments:
+        return []
+    cache = cache or default_cache()
+
+    configure_pool(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda attachment: download_attachment(attachment, output_dir, table_sys_id, cache),
+                               attachments)
+        return [result for result in results if result]
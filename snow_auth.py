@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'servicenow_api_ops', 'token.json')
+
+# A token is treated as expired this many seconds early so in-flight requests never carry a dead token
+REFRESH_MARGIN = 60
+# The background timer renews the token this many seconds before it would go stale
+BACKGROUND_LEAD = 120
+
+
+class TokenManager:
+    """Process-wide OAuth token cache shared by threads and asyncio tasks.
+
+    Concurrent callers that find the token stale (or rejected with a 401) wait
+    for a single password-grant request instead of each issuing their own, a
+    daemon timer renews the token shortly before it expires, and the token is
+    persisted to a local cache file so back-to-back runs reuse it.
+    """
+
+    def __init__(self, token_url, get_session, cache_path=DEFAULT_CACHE_PATH, background_refresh=True):
+        self.token_url = token_url
+        self.get_session = get_session
+        self.cache_path = cache_path
+        self.background_refresh = background_refresh
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires = 0
+        self._timer = None
+        self._pending = {}
+        self._load_cache()
+
+    def _credentials(self):
+        return {
+            'grant_type': 'password',
+            'username': os.getenv('SNOW_USERNAME'),
+            'password': os.getenv('SNOW_PASSWORD'),
+            'client_id': os.getenv('SNOW_CLIENT_ID'),
+            'client_secret': os.getenv('SNOW_CLIENT_SECRET')
+        }
+
+    def _cache_key(self):
+        return f"{self.token_url}|{os.getenv('SNOW_USERNAME')}|{os.getenv('SNOW_CLIENT_ID')}"
+
+    def _is_fresh(self):
+        return self._token is not None and time.time() < self._expires - REFRESH_MARGIN
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get('key') == self._cache_key() and time.time() < cached.get('expires', 0) - REFRESH_MARGIN:
+            self._token = cached['access_token']
+            self._expires = cached['expires']
+            self._schedule_background_refresh()
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'key': self._cache_key(), 'access_token': self._token, 'expires': self._expires}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not write token cache {self.cache_path}: {e}")
+
+    def _request_token_locked(self):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        response = self.get_session().post(self.token_url, data=urlencode(self._credentials()), headers=headers)
+        response.raise_for_status()
+        data = response.json()
+        print(f"🔑 Token request status: {response.status_code}")
+        self._token = data['access_token']
+        self._expires = time.time() + int(data['expires_in'])
+        self._save_cache()
+        self._schedule_background_refresh()
+        return self._token
+
+    def _schedule_background_refresh(self):
+        if not self.background_refresh:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        remaining = self._expires - time.time()
+        # Short-lived tokens are renewed half way through their lifetime instead
+        delay = max(remaining / 2, remaining - REFRESH_MARGIN - BACKGROUND_LEAD)
+        self._timer = threading.Timer(delay, self._background_refresh, args=(self._token,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self, token):
+        try:
+            self.refresh(rejected=token)
+        except Exception as e:
+            # The next foreground caller will retry once the token actually goes stale
+            print(f"⚠️ Background token refresh failed: {e}")
+
+    def get_token(self):
+        """Return a valid token, requesting a new one only if the cached one is stale."""
+        if self._is_fresh():
+            return self._token
+        with self._lock:
+            if self._is_fresh():
+                return self._token
+            return self._request_token_locked()
+
+    def refresh(self, rejected=None):
+        """Force a new token, unless another caller already replaced the rejected one."""
+        with self._lock:
+            if rejected is not None and self._token != rejected and self._is_fresh():
+                return self._token
+            print("🔄 Access token expired or rejected, refreshing token...")
+            return self._request_token_locked()
+
+    async def _coalesce(self, key, func, *args):
+        # Tasks on the same loop await one executor call instead of each blocking a worker thread
+        loop = asyncio.get_running_loop()
+        pending_key = (id(loop), key)
+        future = self._pending.get(pending_key)
+        if future is None:
+            future = loop.run_in_executor(None, func, *args)
+            self._pending[pending_key] = future
+            future.add_done_callback(lambda _: self._pending.pop(pending_key, None))
+        return await asyncio.shield(future)
+
+    async def aget_token(self):
+        if self._is_fresh():
+            return self._token
+        return await self._coalesce('get', self.get_token)
+
+    async def arefresh(self, rejected=None):
+        return await self._coalesce(('refresh', rejected), self.refresh, rejected)
+
+    def clear(self):
+        """Forget the cached token in memory and on disk."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._token = None
+            self._expires = 0
+            if self.cache_path and os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
@@ -0,0 +1,136 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import zipfile
+
+CHECKPOINT_FILE = 'checkpoint.db'
+
+
+def _looks_complete(path):
+    """Cheap format check for files whose size is not known up front."""
+    if path.endswith('.docx'):
+        return zipfile.is_zipfile(path)
+    if path.endswith('.pdf'):
+        with open(path, 'rb') as f:
+            return f.read(5) == b'%PDF-'
+    return True
+
+
+class Checkpoint:
+    """Journal of finished work in an export folder, so an interrupted run can resume.
+
+    Entries are (kind, key) pairs such as ('page', '12') or ('pdf', sys_id),
+    optionally with the file they produced and its size. An entry only counts
+    as done while that file still exists with the recorded size, so files
+    deleted or truncated since are fetched again. Safe to share between
+    worker threads.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, CHECKPOINT_FILE)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS done (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                path TEXT,
+                size INTEGER,
+                info TEXT,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def get_meta(self, name, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, name, value):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+
+    def mark_done(self, kind, key, path=None, info=None):
+        size = os.path.getsize(path) if path and os.path.exists(path) else None
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO done (kind, key, path, size, info) VALUES (?, ?, ?, ?, ?)",
+                              (kind, str(key), path, size, json.dumps(info) if info is not None else None))
+
+    def entry(self, kind, key):
+        """Return (path, info) for a validated entry, or None if the work has to be redone."""
+        with self._lock:
+            row = self.conn.execute("SELECT path, size, info FROM done WHERE kind = ? AND key = ?",
+                                    (kind, str(key))).fetchone()
+        if row is None:
+            return None
+        path, size, info = row
+        if path is not None:
+            if not os.path.exists(path) or (size is not None and os.path.getsize(path) != size):
+                return None
+            if not _looks_complete(path):
+                return None
+        return path, json.loads(info) if info is not None else None
+
+    def is_done(self, kind, key):
+        return self.entry(kind, key) is not None
+
+    def entries(self, kind):
+        """Return {key: (path, info)} for every journalled entry of a kind, without validating files."""
+        with self._lock:
+            rows = self.conn.execute("SELECT key, path, info FROM done WHERE kind = ?", (kind,)).fetchall()
+        return {key: (path, json.loads(info) if info is not None else None) for key, path, info in rows}
+
+    def mark_complete(self):
+        """Record that the export finished, so latest_export_folder stops offering it for --resume."""
+        self.set_meta('complete', True)
+
+    def is_complete(self):
+        return bool(self.get_meta('complete', False))
+
+    def close(self):
+        self.conn.close()
+
+
+def remove_partial_files(folder):
+    """Delete the .part files left behind by downloads that were interrupted; returns how many."""
+    partials = glob.glob(os.path.join(folder, '**', '.*.part'), recursive=True)
+    for path in partials:
+        os.remove(path)
+    if partials:
+        print(f"🧹 Removed {len(partials)} partial download(s) from {folder}")
+    return len(partials)
+
+
+def export_complete(folder):
+    """Return True if the export journalled in folder ran to the end (see Checkpoint.mark_complete)."""
+    if not os.path.exists(os.path.join(folder, CHECKPOINT_FILE)):
+        return False
+    checkpoint = Checkpoint(folder)
+    try:
+        return checkpoint.is_complete()
+    finally:
+        checkpoint.close()
+
+
+def latest_export_folder(prefix, export):
+    """Return the newest <prefix>_<timestamp> folder of the given export if it is unfinished, or None.
+
+    When the newest such export completed there is nothing to resume, and
+    older unfinished ones are not picked up in its place.
+    """
+    for path in sorted(glob.glob(f"{prefix}_*"), reverse=True):
+        if not os.path.exists(os.path.join(path, CHECKPOINT_FILE)):
+            continue
+        checkpoint = Checkpoint(path)
+        try:
+            if checkpoint.get_meta('export') == export:
+                return None if checkpoint.is_complete() else path
+        finally:
+            checkpoint.close()
+    return None
@@ -0,0 +1,169 @@
+import os
+import threading
+import uuid
+from urllib.parse import urlparse
+
+import requests
+from requests.auth import AuthBase
+from dotenv import load_dotenv
+
+from snow_auth import DEFAULT_CACHE_PATH, TokenManager
+from snow_ratelimit import RateLimitedAdapter
+
+load_dotenv()
+
+INSTANCE_URL = os.getenv('SNOW_INSTANCE_URL', 'https://lendlease.service-now.com').rstrip('/')
+TOKEN_PATH = '/oauth_token.do'
+
+# Size the pool to the number of worker threads so concurrent requests reuse
+# keep-alive connections instead of opening (and TLS-handshaking) new ones.
+DEFAULT_POOL_SIZE = int(os.getenv('SNOW_POOL_SIZE', '10'))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+_pool_size = DEFAULT_POOL_SIZE
+
+# Set SNOW_TOKEN_CACHE to an empty value to keep the token in memory only
+TOKEN_CACHE_PATH = os.getenv('SNOW_TOKEN_CACHE', DEFAULT_CACHE_PATH)
+
+_token_manager = None
+
+
+def snow_url(path):
+    """Build an absolute URL on the ServiceNow instance from a relative path."""
+    return f"{INSTANCE_URL}/{path.lstrip('/')}"
+
+
+def _is_instance_url(url):
+    return urlparse(url).netloc == urlparse(INSTANCE_URL).netloc
+
+
+class BearerAuth(AuthBase):
+    """Attach the cached bearer token to instance requests and retry once on 401."""
+
+    def __call__(self, r):
+        # Never send the ServiceNow token to other hosts (e.g. Confluence) or to the token endpoint itself
+        if not _is_instance_url(r.url) or urlparse(r.url).path == TOKEN_PATH:
+            return r
+        r.headers['Authorization'] = f'Bearer {get_bearer_token()}'
+        r.register_hook('response', self.handle_401)
+        return r
+
+    def handle_401(self, r, **kwargs):
+        if r.status_code != 401 or getattr(r.request, 'snow_token_retried', False):
+            return r
+
+        rejected = r.request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        token = get_bearer_token(force_refresh=True, rejected=rejected)
+
+        # Drain and release the original connection before re-sending
+        r.content
+        r.close()
+        prep = r.request.copy()
+        prep.headers['Authorization'] = f'Bearer {token}'
+        prep.snow_token_retried = True
+
+        retry = r.connection.send(prep, **kwargs)
+        retry.history.append(r)
+        retry.request = prep
+        return retry
+
+
+def _mount_adapters(session, pool_size):
+    # Every request, to ServiceNow or Confluence, goes through its host's adaptive limiter and retry policy
+    adapter = RateLimitedAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def get_session():
+    """Return the process-wide keep-alive session shared by every script."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                _mount_adapters(session, _pool_size)
+                session.auth = BearerAuth()
+                _session = session
+    return _session
+
+
+def configure_pool(pool_size):
+    """Grow the connection pool to at least pool_size, typically the number of worker threads."""
+    global _pool_size
+    with _session_lock:
+        if pool_size <= _pool_size:
+            return
+        _pool_size = int(pool_size)
+        if _session is not None:
+            _mount_adapters(_session, _pool_size)
+
+
+def download_to_file(url, file_path, expected_size=None, params=None):
+    """Stream a response body to file_path in chunks; returns the HTTP response.
+
+    The body goes to a temporary file in the same folder and is renamed into
+    place only once complete (and, when expected_size is given, only if the
+    size matches), so a partial download never looks like a finished file.
+    The file is only written for a 200 response.
+    """
+    response = get_session().get(url, params=params, stream=True)
+    if response.status_code != 200:
+        # Load the (small) error body so callers can still print response.text
+        response.content
+        return response
+
+    folder = os.path.dirname(file_path) or '.'
+    tmp_path = os.path.join(folder, f".{os.path.basename(file_path)}.{uuid.uuid4().hex[:8]}.part")
+    # os.open rather than mkstemp so the finished file gets the usual umask-based permissions
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        written = 0
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                written += len(chunk)
+        if expected_size is not None and written != int(expected_size):
+            raise IOError(f"expected {expected_size} bytes but received {written}")
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        response.close()
+    return response
+
+
+def get_token_manager():
+    """Return the process-wide token manager for the configured instance."""
+    global _token_manager
+    if _token_manager is None:
+        with _session_lock:
+            if _token_manager is None:
+                _token_manager = TokenManager(snow_url(TOKEN_PATH), get_session, cache_path=TOKEN_CACHE_PATH)
+    return _token_manager
+
+
+def get_bearer_token(force_refresh=False, rejected=None):
+    manager = get_token_manager()
+    try:
+        if force_refresh:
+            return manager.refresh(rejected=rejected)
+        return manager.get_token()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Token request failed: {str(e)}")
+        raise SystemExit(1)
+
+
+async def aget_bearer_token(force_refresh=False, rejected=None):
+    manager = get_token_manager()
+    try:
+        if force_refresh:
+            return await manager.arefresh(rejected=rejected)
+        return await manager.aget_token()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Token request failed: {str(e)}")
+        raise SystemExit(1)
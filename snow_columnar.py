@@ -0,0 +1,214 @@
+import csv
+import datetime
+import glob
+import json
+import os
+import re
+
+from snow_output import iter_ndjson
+from snow_stream import iter_json_file_records
+
+# Rows buffered per Parquet row group (and per CSV write)
+DEFAULT_ROW_GROUP_SIZE = 50000
+
+_INT = re.compile(r'-?\d+$')
+_FLOAT = re.compile(r'-?(\d+\.\d*|\.\d+|\d+)([eE][-+]?\d+)?$')
+_TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+# Two kinds that can share a column without falling back to strings
+_WIDENS = {frozenset(('int', 'float')): 'float', frozenset(('date', 'timestamp')): 'timestamp'}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        print("❌ Parquet output needs the 'pyarrow' package (pip install pyarrow)")
+        raise SystemExit(1)
+    return pyarrow
+
+
+def _input_files(path):
+    """Expand an export folder into the files holding its records, in page order."""
+    if not os.path.isdir(path):
+        return [path]
+    streams = sorted(glob.glob(os.path.join(path, 'all_records_combined_*.ndjson*')))
+    if streams:
+        return streams
+    batches = glob.glob(os.path.join(path, 'records_batch_*.json'))
+    return sorted(batches, key=lambda name: int(re.search(r'_(\d+)\.json$', name).group(1)))
+
+
+def iter_export_records(paths):
+    """Yield every record of the given NDJSON files, JSON batch files, table responses or export folders.
+
+    JSON documents are parsed incrementally and NDJSON is read line by line,
+    so only the current record is held in memory.
+    """
+    for path in paths:
+        for file_path in _input_files(path):
+            if re.search(r'\.ndjson(\.gz|\.zst)?$', file_path):
+                yield from iter_ndjson(file_path)
+                continue
+            yield from iter_json_file_records(file_path)
+
+
+def flatten_record(record):
+    """Turn reference/display objects into plain columns.
+
+    {'display_value', 'value', 'link'} objects become <field> (the display
+    value, or the value when there is none), <field>.value when both are
+    present and <field>.link. Any other nested value is kept as JSON text.
+    """
+    row = {}
+    for field, value in record.items():
+        if isinstance(value, dict) and value.keys() & {'display_value', 'value', 'link'}:
+            if 'display_value' in value:
+                row[field] = value['display_value']
+                if 'value' in value:
+                    row[f"{field}.value"] = value['value']
+            else:
+                row[field] = value.get('value')
+            if 'link' in value:
+                row[f"{field}.link"] = value['link']
+        elif isinstance(value, (dict, list)):
+            row[field] = json.dumps(value, ensure_ascii=False)
+        else:
+            row[field] = value
+    return row
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if value in ('true', 'false'):
+        return 'bool'
+    if _INT.match(value):
+        # Leading zeros (employee numbers, postcodes) mark identifiers rather than numbers,
+        # and anything past int64 is an identifier too
+        digits = value.lstrip('-')
+        return 'int' if len(digits) <= 18 and (len(digits) == 1 or not digits.startswith('0')) else 'string'
+    if _FLOAT.match(value):
+        return 'float'
+    if _TIMESTAMP.match(value):
+        return 'timestamp'
+    if _DATE.match(value):
+        return 'date'
+    return 'string'
+
+
+class Schema:
+    """Union of the columns seen across all rows, each with the narrowest type that fits every value.
+
+    Columns keep the order they were first seen in. Empty strings count as
+    nulls, so a column only loses its type when a real value disagrees.
+    """
+
+    def __init__(self):
+        self.kinds = {}
+
+    def add(self, row):
+        for column, value in row.items():
+            kind = self.kinds.get(column)
+            if value is None or value == '':
+                self.kinds.setdefault(column, None)
+                continue
+            if kind == 'string':
+                continue
+            new = _kind(value)
+            if kind is None or kind == new:
+                self.kinds[column] = new
+            else:
+                self.kinds[column] = _WIDENS.get(frozenset((kind, new)), 'string')
+
+    @property
+    def columns(self):
+        return list(self.kinds)
+
+    def convert(self, column, value):
+        """Return value as the Python type of its column (None for empty values)."""
+        if value is None or value == '':
+            return None
+        kind = self.kinds[column]
+        if kind == 'bool':
+            return value if isinstance(value, bool) else value == 'true'
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if kind == 'timestamp':
+            if _DATE.match(value):
+                value += ' 00:00:00'
+            return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        if kind == 'date':
+            return datetime.date.fromisoformat(value)
+        return value if isinstance(value, str) else str(value)
+
+    def arrow_schema(self):
+        pyarrow = _import_pyarrow()
+        types = {'bool': pyarrow.bool_(), 'int': pyarrow.int64(), 'float': pyarrow.float64(),
+                 'timestamp': pyarrow.timestamp('s'), 'date': pyarrow.date32()}
+        return pyarrow.schema([(column, types.get(kind, pyarrow.string())) for column, kind in self.kinds.items()])
+
+
+def infer_schema(records):
+    schema = Schema()
+    for record in records:
+        schema.add(flatten_record(record))
+    return schema
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(flatten_record(record))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def convert_records(open_records, csv_path=None, parquet_path=None, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Write the records to an all-quoted CSV and/or a typed Parquet file in two streaming passes.
+
+    open_records() must return a fresh iterator over the records each time
+    it is called: the first pass infers the union schema, the second writes
+    row groups of row_group_size rows. Returns (rows written, schema).
+    """
+    schema = infer_schema(open_records())
+    columns = schema.columns
+    if not columns:
+        return 0, schema
+
+    csv_file = csv_writer = parquet_writer = None
+    if csv_path:
+        csv_file = open(csv_path, 'w', encoding='utf-8', newline='')
+        csv_writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
+        csv_writer.writerow(columns)
+    if parquet_path:
+        pyarrow = _import_pyarrow()
+        arrow_schema = schema.arrow_schema()
+        parquet_writer = pyarrow.parquet.ParquetWriter(parquet_path, arrow_schema, compression='zstd')
+
+    written = 0
+    try:
+        for batch in _batches(open_records(), row_group_size):
+            if csv_writer:
+                csv_writer.writerows([['' if row.get(column) is None else str(row[column]) for column in columns]
+                                      for row in batch])
+            if parquet_writer:
+                arrays = {column: [schema.convert(column, row.get(column)) for row in batch] for column in columns}
+                parquet_writer.write_table(pyarrow.table(arrays, schema=arrow_schema))
+            written += len(batch)
+    finally:
+        if csv_file:
+            csv_file.close()
+        if parquet_writer:
+            parquet_writer.close()
+    return written, schema
@@ -0,0 +1,311 @@
+import asyncio
+import datetime
+import json
+import os
+import time
+from functools import partial
+from urllib.parse import quote
+
+import requests
+
+import snow_async
+from snow_async import DEFAULT_ASYNC_CONCURRENCY
+from snow_attachments import DEFAULT_ATTACHMENT_WORKERS
+from snow_checkpoint import Checkpoint, remove_partial_files
+from snow_client import download_to_file, get_session, snow_url
+from snow_output import JSONResultWriter, NDJSONWriter
+from snow_pagination import DEFAULT_WORKERS, iter_keyset_pages, iter_offset_pages, raw_value
+from snow_pipeline import DEFAULT_PDF_WORKERS, arun_ticket_pipeline, run_ticket_pipeline
+from snow_shards import iter_sharded_pages, plan_shards
+from snow_store import RecordStore
+from snow_stream import iter_result_records
+from table_profiles import profile_params
+
+# Records handed to the writer at a time while a response streams in
+WRITE_BATCH_SIZE = 500
+DEFAULT_SHARDS = 4
+
+
+def fetch_table(profile, batch_size=1000, max_workers=DEFAULT_WORKERS, mode='offset', output_format='json',
+                compression=None, params=None, backend='threads', concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                resume_folder=None, store_path=None, shards=DEFAULT_SHARDS):
+    """Export every record of a registry table into a new <folder_prefix>_<timestamp> folder.
+
+    output_format is 'json' (batch files plus a combined file), 'ndjson' (one
+    stream, optionally compressed) or 'sqlite' (upserts into store_path).
+    mode 'sharded' splits the table into `shards` sys_created_on ranges and
+    walks them concurrently, max_workers at a time.
+    Every saved page is journalled, so resume_folder continues an
+    interrupted export with the settings it was started with. Returns the
+    export folder, record count and the settings actually used.
+    """
+    start_time = time.time()
+    table = profile['table']
+    if params is None:
+        params = profile_params(table, 'full')
+
+    total_records = 0
+    all_results = []
+
+    if resume_folder:
+        # Continue an interrupted run in its own folder, with the settings it was started with
+        master_folder = resume_folder
+        checkpoint = Checkpoint(master_folder)
+        timestamp = checkpoint.get_meta('timestamp')
+        settings = checkpoint.get_meta('settings')
+        batch_size, mode, output_format, compression, params, store_path, shards = (
+            settings['batch_size'], settings['mode'], settings['format'], settings['compression'], settings['params'],
+            settings.get('store'), settings.get('shards'))
+        remove_partial_files(master_folder)
+    else:
+        if output_format == 'sqlite':
+            # The store keeps raw and display values so its indexed columns can be filled from either
+            params = dict(params, sysparm_display_value='all')
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        master_folder = f"{profile['folder_prefix']}_{timestamp}"
+        os.makedirs(master_folder, exist_ok=True)
+        checkpoint = Checkpoint(master_folder)
+        checkpoint.set_meta('export', 'fetch')
+        checkpoint.set_meta('timestamp', timestamp)
+        checkpoint.set_meta('settings', {'batch_size': batch_size, 'mode': mode, 'format': output_format,
+                                         'compression': compression, 'params': params, 'store': store_path,
+                                         'shards': shards})
+
+    stream_path = os.path.join(master_folder, f"all_records_combined_{timestamp}.ndjson")
+    # Pages are saved in order, so the finished ones always run unbroken from page 1
+    done_pages = 0
+    while checkpoint.is_done('page', done_pages + 1):
+        done_pages += 1
+    last_page = checkpoint.entry('page', done_pages)[1] if done_pages else None
+    if output_format == 'ndjson' and done_pages and (compression or not os.path.exists(stream_path)
+                                                     or os.path.getsize(stream_path) < last_page['offset']):
+        print("ℹ️ The NDJSON stream cannot be continued; fetching it again from the start")
+        done_pages, last_page = 0, None
+    if resume_folder:
+        print(f"⏯️ Resuming {master_folder} after {done_pages} saved page(s)")
+        for page in range(1, done_pages + 1):
+            total_records += checkpoint.entry('page', page)[1]['records']
+            if output_format == 'json':
+                with open(checkpoint.entry('page', page)[0], "r", encoding="utf-8") as f:
+                    all_results.extend(json.load(f))
+
+    if mode == 'keyset':
+        # Sequential, but each page costs the same at any depth and stays consistent under updates
+        start_after = tuple(last_page['cursor']) if last_page else None
+        pages = ((page + done_pages, batch, cursor) for page, batch, cursor in
+                 iter_keyset_pages(table, params, page_size=batch_size, start_after=start_after, with_cursor=True))
+    elif mode == 'sharded':
+        pages = _sharded_pages(checkpoint, table, params, batch_size, max_workers, shards, done_pages)
+    elif backend == 'async':
+        # Same offset pages, fetched by one event loop with many more requests in flight than threads allow
+        pages = ((page, batch, None) for page, batch in
+                 snow_async.iter_offset_pages(table, params, page_size=batch_size, concurrency=concurrency,
+                                              skip_pages=range(1, done_pages + 1)))
+    else:
+        pages = ((page, batch, None) for page, batch in
+                 iter_offset_pages(table, params, page_size=batch_size, max_workers=max_workers,
+                                   skip_pages=range(1, done_pages + 1)))
+
+    # NDJSON streams every page straight to one file instead of holding the whole table in memory
+    stream = None
+    if output_format == 'ndjson':
+        stream = NDJSONWriter(stream_path, compression, resume_offset=last_page['offset'] if last_page else None)
+    # sqlite upserts every page into the indexed record store, so re-fetched pages simply overwrite
+    store = RecordStore(store_path) if output_format == 'sqlite' else None
+
+    try:
+        for batch_num, batch, cursor in pages:
+            batch_count = len(batch)
+
+            if stream:
+                stream.write_records(batch)
+                checkpoint.mark_done('page', batch_num, info={'records': batch_count, 'cursor': cursor,
+                                                              'offset': None if compression else stream.tell()})
+                print(f"📄 Streamed batch {batch_num} ({batch_count} records) to {stream.path}")
+            elif store:
+                store.upsert(table, batch)
+                # The store also holds earlier runs, so journal which rows this one wrote (see stored_sys_ids)
+                checkpoint.mark_done('page', batch_num, info={'records': batch_count, 'cursor': cursor,
+                                                              'sys_ids': [raw_value(r, 'sys_id') for r in batch]})
+                print(f"📄 Stored batch {batch_num} ({batch_count} records) in {store_path}")
+            else:
+                # Save each batch to a separate file
+                batch_filename = os.path.join(master_folder, f"records_batch_{batch_num}.json")
+                with open(batch_filename, "w", encoding="utf-8") as f:
+                    json.dump(batch, f, indent=2)
+                checkpoint.mark_done('page', batch_num, batch_filename, info={'records': batch_count, 'cursor': cursor})
+                print(f"📄 Saved {batch_count} records to {batch_filename}")
+                all_results.extend(batch)
+
+            total_records += batch_count
+
+        if output_format == 'json':
+            # Save combined file
+            combined_file = os.path.join(master_folder, f"all_records_combined_{timestamp}.json")
+            with open(combined_file, "w", encoding="utf-8") as f:
+                json.dump(all_results, f, indent=2)
+        checkpoint.mark_complete()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ API request failed: {e}")
+        print(f"   Re-run with --resume {master_folder} to continue from the last saved page")
+        raise SystemExit(1)
+    finally:
+        if stream:
+            stream.close()
+        if store:
+            store.close()
+        checkpoint.close()
+
+    end_time = time.time()
+    duration = end_time - start_time
+    minutes, seconds = divmod(duration, 60)
+
+    print(f"\n📁 {table}: combined total records saved: {total_records}")
+    print(f"⏱️ Total time taken: {int(minutes)} minutes, {int(seconds)} seconds")
+    return {'folder': master_folder, 'records': total_records, 'format': output_format, 'store': store_path}
+
+
+def stored_sys_ids(folder):
+    """Return the sys_ids a sqlite-format fetch_table run journalled in folder, in page order."""
+    checkpoint = Checkpoint(folder)
+    try:
+        pages = checkpoint.entries('page')
+    finally:
+        checkpoint.close()
+    sys_ids = {}
+    for _, (_, info) in sorted(pages.items(), key=lambda item: int(item[0])):
+        sys_ids.update(dict.fromkeys((info or {}).get('sys_ids', [])))
+    return list(sys_ids)
+
+
+def _sharded_pages(checkpoint, table, params, batch_size, max_workers, shards, done_pages):
+    """Number the interleaved pages of a sharded export and journal each shard as it completes.
+
+    The shard plan is kept in the journal, so a resumed export walks the same
+    ranges, continuing every unfinished shard from the last cursor among the
+    pages already saved.
+    """
+    plan = checkpoint.get_meta('shard_plan')
+    if plan is None:
+        plan = plan_shards(table, params.get('sysparm_query', ''), shards)
+        checkpoint.set_meta('shard_plan', plan)
+    print(f"🧩 {table}: {len(plan)} shard(s) on sys_created_on: "
+          + ', '.join(f"{spec['count']}" for spec in plan) + " record(s)")
+
+    cursors = {}
+    for page in range(1, done_pages + 1):
+        shard, after = checkpoint.entry('page', page)[1]['cursor']
+        cursors[shard] = after
+    done_shards = set()
+    for key, (_, info) in checkpoint.entries('shard').items():
+        if info['page'] <= done_pages:
+            done_shards.add(int(key))
+
+    page = done_pages
+    last_page = {}
+    for shard, records, after in iter_sharded_pages(table, params, plan, page_size=batch_size,
+                                                    max_workers=max_workers, cursors=cursors,
+                                                    done_shards=done_shards):
+        if records is None:
+            # Every page of the shard was saved before the next one is requested
+            checkpoint.mark_done('shard', shard, info={'page': last_page.get(shard, 0)})
+            continue
+        page += 1
+        last_page[shard] = page
+        yield page, records, [shard, after]
+
+
+def pdf_url(profile, sys_id):
+    return snow_url(f"{profile['pdf_endpoint']}?PDF&sys_id={sys_id}&sysparm_view={quote(profile['pdf_view'])}")
+
+
+def download_pdf(profile, sys_id, pdf_dir):
+    url = pdf_url(profile, sys_id)
+    filename = f"{sys_id}.pdf"
+    file_path = os.path.join(pdf_dir, filename)
+    response = download_to_file(url, file_path)
+
+    if response.status_code == 200:
+        print(f"   ✓ PDF successfully saved as {file_path}")
+        return True
+    print(f"   ✗ Failed to download PDF for sys_id {sys_id}. Status: {response.status_code}")
+    print(response.text)
+    return False
+
+
+def download_ticket_files(profile, tickets, cache=None, attachment_workers=DEFAULT_ATTACHMENT_WORKERS,
+                          pdf_workers=DEFAULT_PDF_WORKERS, backend='threads', concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                          resume_folder=None):
+    """Download the attachments and PDF of every ticket into a new <folder_prefix>_<timestamp> folder."""
+    print(f"🎫 Processing {len(tickets)} {profile['table']} ticket(s)...")
+
+    if resume_folder:
+        # Files journalled by the interrupted run are kept; everything else is fetched again
+        master_folder = resume_folder
+        remove_partial_files(master_folder)
+        print(f"⏯️ Resuming {master_folder}")
+    else:
+        # Create master folder with timestamp
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
+        master_folder = f"{profile['folder_prefix']}_{timestamp}"
+        os.makedirs(master_folder, exist_ok=True)
+    checkpoint = Checkpoint(master_folder)
+    checkpoint.set_meta('export', 'tickets')
+
+    # Attachment downloads and PDF renders for different tickets overlap
+    try:
+        if backend == 'async':
+            stats = asyncio.run(arun_ticket_pipeline(tickets, master_folder, partial(pdf_url, profile), cache=cache,
+                                                     concurrency=concurrency, checkpoint=checkpoint))
+        else:
+            stats = run_ticket_pipeline(tickets, master_folder, partial(download_pdf, profile), cache=cache,
+                                        attachment_workers=attachment_workers, pdf_workers=pdf_workers,
+                                        checkpoint=checkpoint)
+        # A run with failed files stays resumable, so --resume can retry just those
+        if not stats['attachments_failed'] and not stats['pdfs_failed']:
+            checkpoint.mark_complete()
+        return stats
+    finally:
+        checkpoint.close()
+
+
+def fetch_response(profile, limit, offset, output_format='json', compression=None):
+    """Save one page of a registry table to <response_prefix>_<timestamp>.json (or .ndjson); returns the record count."""
+    url = snow_url(f"api/now/table/{profile['table']}")
+    params = {
+        "sysparm_display_value": "true",
+        "sysparm_view": "Default view",
+        "sysparm_limit": limit,
+        "sysparm_offset": offset
+    }
+
+    try:
+        # Parse the body as it arrives and write each record straight out, so memory does not grow with --limit
+        response = get_session().get(url, params=params, stream=True)
+        response.raise_for_status()
+        current_datetime = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"{profile['response_prefix']}_{current_datetime}.{output_format}"
+        if output_format == 'ndjson':
+            writer = NDJSONWriter(filename, compression)
+        else:
+            writer = JSONResultWriter(filename)
+        with writer:
+            batch = []
+            for record in iter_result_records(response):
+                batch.append(record)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    writer.write_records(batch)
+                    batch = []
+            writer.write_records(batch)
+        print(f"✅ Response saved to {writer.path}")
+        print(f"   Records fetched: {writer.count}")
+        return writer.count
+    except requests.exceptions.RequestException as e:
+        print(f"❌ API request failed: {e}")
+        if hasattr(e, 'response') and e.response:
+            print(f"   Status code: {e.response.status_code}")
+            print(f"   Response: {e.response.text}")
+        raise SystemExit(1)
+    except json.JSONDecodeError:
+        print("❌ Invalid JSON response from API")
+        raise SystemExit(1)
@@ -0,0 +1,321 @@
+import hashlib
+import math
+import os
+import re
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from bs4 import BeautifulSoup
+from docx.shared import Inches
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+USED_IMAGES_FOLDER = 'used_images'
+# Optimized image copies, named <sha256 of the original>_<width in pixels>.<ext>
+IMAGE_CACHE_DIR = os.getenv('SNOW_IMAGE_CACHE', 'image_cache')
+DEFAULT_IMAGE_DPI = int(os.getenv('SNOW_IMAGE_DPI', '150'))
+DEFAULT_IMAGE_WORKERS = int(os.getenv('SNOW_IMAGE_WORKERS', str(os.cpu_count() or 1)))
+JPEG_QUALITY = 85
+# Formats optimize_image writes back in the same format; the rest become PNG
+SAME_FORMAT_OUTPUTS = ('JPEG', 'PNG', 'WEBP')
+EXIF_ORIENTATION = 0x0112
+# Display widths: top-level and table-cell images in the KB DOCX exports, and a fixed-width Confluence page body
+DOCX_IMAGE_WIDTH = Inches(4)
+DOCX_TABLE_IMAGE_WIDTH = Inches(0.5)
+CONFLUENCE_IMAGE_WIDTH = Inches(8)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp', '.heic', '.heif')
+# Leading bytes of the formats python-docx embeds as they are; anything else is transcoded to PNG
+DOCX_IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',        # PNG
+    b'\xff\xd8\xff',               # JPEG
+    b'GIF87a', b'GIF89a',           # GIF
+    b'BM',                          # BMP
+    b'II*\x00', b'MM\x00*',         # TIFF
+)
+
+_IMAGE_SYS_ID = re.compile(r'sys_id=([a-zA-Z0-9]+)')
+
+
+def image_sys_id(src):
+    """Return the attachment sys_id an <img src="sys_attachment.do?sys_id=..."> points at, or None."""
+    match = _IMAGE_SYS_ID.search(src or '')
+    return match.group(1) if match else None
+
+
+def attachment_index(downloaded):
+    """Map attachment sys_id -> local path for the file dicts returned by the attachment downloaders."""
+    return {attachment['sys_id']: attachment['file_path'] for attachment in downloaded if attachment.get('sys_id')}
+
+
+def folder_image_index(folder):
+    """Map attachment sys_id -> path for the <sys_id>_<file_name> files in folder and its used_images folder.
+
+    The folder is listed once; files in folder win over copies already moved
+    to used_images. Names are matched on their sys_id prefix exactly.
+    """
+    index = {}
+    for search_dir in (folder, os.path.join(folder, USED_IMAGES_FOLDER)):
+        if not os.path.isdir(search_dir):
+            continue
+        for filename in os.listdir(search_dir):
+            sys_id, sep, _ = filename.partition('_')
+            if sep and sys_id not in index:
+                index[sys_id] = os.path.join(search_dir, filename)
+    return index
+
+
+# Optimized copy to embed instead of an image, by (original path, display width in EMU); see optimize_images
+_renditions = {}
+# PNG bytes of the most recently transcoded images, by SHA-256 of the original file (least recently used dropped)
+TRANSCODE_CACHE_SIZE = 32
+_transcoded = OrderedDict()
+_heif_registered = False
+
+
+def _register_heif():
+    """Teach Pillow to read HEIC/HEIF, if the optional pillow-heif package is installed."""
+    global _heif_registered
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        return False
+    register_heif_opener()
+    _heif_registered = True
+    return True
+
+
+def _open_image(data):
+    try:
+        return Image.open(BytesIO(data))
+    except UnidentifiedImageError:
+        if _heif_registered or not _register_heif():
+            raise
+        return Image.open(BytesIO(data))
+
+
+def transcode_to_png(data):
+    """Return data (an image python-docx cannot read, e.g. WebP or HEIC) as PNG bytes.
+
+    The last TRANSCODE_CACHE_SIZE results are kept by content hash, so an
+    image repeated across nearby articles is transcoded once without holding
+    every image of a large export in memory.
+    """
+    key = hashlib.sha256(data).hexdigest()
+    png = _transcoded.get(key)
+    if png is not None:
+        _transcoded.move_to_end(key)
+        return png
+    img = _open_image(data)
+    if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    png = _transcoded[key] = buffer.getvalue()
+    if len(_transcoded) > TRANSCODE_CACHE_SIZE:
+        _transcoded.popitem(last=False)
+    return png
+
+
+def picture_stream(path):
+    """Return a stream of the image at path that python-docx can embed.
+
+    PNG, JPEG, GIF, BMP and TIFF files are passed through byte for byte,
+    without a Pillow decode/re-encode; other formats are transcoded to PNG.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(DOCX_IMAGE_SIGNATURES):
+        data = transcode_to_png(data)
+    return BytesIO(data)
+
+
+def add_picture(run, path, width):
+    """Add the image at path to run; on failure the run says so instead. Returns True if it was added."""
+    try:
+        run.add_picture(picture_stream(_renditions.get((path, int(width)), path)), width=width)
+        return True
+    except Exception as e:
+        print(f"❌ Failed to add image {os.path.basename(path)}. Reason: {e}")
+        run.text = f"[Failed to insert image: {os.path.basename(path)}]"
+        return False
+
+
+def add_image_run(paragraph, sys_id, images, width, used=None):
+    """Append the attachment sys_id from the images index to paragraph, or a note that it is missing.
+
+    used collects {sys_id: path} of the images placed, for move_used_images.
+    """
+    return place_image(paragraph.add_run(), sys_id, images, width, used)
+
+
+def place_image(run, sys_id, images, width, used=None):
+    """Put the attachment sys_id from the images index into an existing run, replacing its text."""
+    path = images.get(sys_id) if sys_id else None
+    if path is None:
+        run.text = f"[No image found for {sys_id or 'UNKNOWN'}]"
+        return run
+    if used is not None:
+        used[sys_id] = path
+    run.clear()
+    add_picture(run, path, width)
+    return run
+
+
+def move_used_images(folder, used):
+    """Move the images placed in a document into <folder>/used_images, keeping files already there."""
+    used_folder = os.path.join(folder, USED_IMAGES_FOLDER)
+    os.makedirs(used_folder, exist_ok=True)
+    for path in set(used.values()):
+        destination = os.path.join(used_folder, os.path.basename(path))
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(folder) and not os.path.exists(destination):
+            shutil.move(path, destination)
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def display_pixels(width, dpi=DEFAULT_IMAGE_DPI):
+    """Pixels needed to show an image width (a docx Length) wide at dpi."""
+    return max(1, math.ceil(width.inches * dpi))
+
+
+def _cached_rendition(cache_dir, key):
+    for ext in ('.png', '.jpg', '.webp'):
+        path = os.path.join(cache_dir, key + ext)
+        if os.path.exists(path):
+            return path
+    # An empty .orig marker records that the original could not be improved on
+    return 'original' if os.path.exists(os.path.join(cache_dir, key + '.orig')) else None
+
+
+def _write_cache(cache_dir, name, data):
+    path = os.path.join(cache_dir, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def optimize_image(path, max_pixels, cache_dir=IMAGE_CACHE_DIR, keep_format=False):
+    """Return the image at path scaled down to at most max_pixels wide and recompressed.
+
+    JPEG and WebP images stay in their format, everything else becomes PNG.
+    The EXIF orientation is applied to the pixels; the colour profile and
+    remaining EXIF data are kept.
+    Results are cached in cache_dir by content hash and width, so an image
+    shared by many articles is processed once. Returns path itself when the
+    image is already small enough and recompressing it would not shrink it,
+    or when it is animated. With keep_format, images of any other format are
+    also returned as they are, for callers that keep the original file name.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    img = _open_image(data)
+    source_format = img.format
+    if keep_format and source_format not in SAME_FORMAT_OUTPUTS:
+        return path
+    key = f"{hashlib.sha256(data).hexdigest()}_{max_pixels}"
+    cached = _cached_rendition(cache_dir, key)
+    if cached:
+        return path if cached == 'original' else cached
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if getattr(img, 'is_animated', False):
+        _write_cache(cache_dir, key + '.orig', b'')
+        return path
+    # Apply the EXIF orientation before measuring, so phone photos come out upright
+    rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+    img = ImageOps.exif_transpose(img)
+    # Colour profile and metadata (orientation now reset) carried over to the re-encoded file
+    metadata = {}
+    if img.info.get('icc_profile'):
+        metadata['icc_profile'] = img.info['icc_profile']
+    exif = img.getexif()
+    resized = img.width > max_pixels
+    if resized:
+        if img.mode in ('1', 'P'):
+            # Palette images are resized nearest-neighbour; go through RGB(A) for a smooth result
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        img = img.resize((max_pixels, max(1, round(img.height * max_pixels / img.width))), Image.LANCZOS)
+
+    buffer = BytesIO()
+    if source_format == 'JPEG':
+        if img.mode not in ('L', 'RGB', 'CMYK'):
+            img = img.convert('RGB')
+        if exif:
+            metadata['exif'] = exif.tobytes()
+        img.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True, **metadata)
+        ext = '.jpg'
+    elif source_format == 'WEBP':
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        if exif:
+            metadata['exif'] = exif.tobytes()
+        img.save(buffer, format='WEBP', quality=JPEG_QUALITY, method=6, **metadata)
+        ext = '.webp'
+    else:
+        if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        img.save(buffer, format='PNG', optimize=True, **metadata)
+        ext = '.png'
+
+    if not resized and not rotated and buffer.tell() >= len(data):
+        _write_cache(cache_dir, key + '.orig', b'')
+        return path
+    return _write_cache(cache_dir, key + ext, buffer.getvalue())
+
+
+def _optimize_job(job):
+    path, max_pixels, cache_dir, keep_format = job
+    try:
+        return optimize_image(path, max_pixels, cache_dir, keep_format)
+    except Exception as e:
+        print(f"⚠️ Could not optimize image {os.path.basename(path)}, using the original. Reason: {e}")
+        return path
+
+
+def optimize_images(placements, dpi=DEFAULT_IMAGE_DPI, workers=DEFAULT_IMAGE_WORKERS, cache_dir=IMAGE_CACHE_DIR,
+                    keep_format=False, executor=None):
+    """Optimize images for display across a process pool; placements is an iterable of (path, width).
+
+    Each distinct image and pixel width is processed once, with
+    optimize_image, by up to workers processes (inline for a single job or
+    worker). Callers optimizing many batches pass a long-lived process pool
+    as executor, so no pool is started per call. The results are
+    registered so add_picture embeds them instead of the originals.
+    keep_format is passed on to optimize_image. Returns
+    {(path, width): optimized path}.
+    """
+    placements = {(path, int(width)): display_pixels(width, dpi) for path, width in placements if is_image(path)}
+    jobs = list(dict.fromkeys((path, max_pixels, cache_dir, keep_format)
+                              for (path, _), max_pixels in placements.items()))
+    if not jobs:
+        return {}
+    if executor is not None and len(jobs) > 1:
+        results = dict(zip(jobs, executor.map(_optimize_job, jobs)))
+    elif workers <= 1 or len(jobs) == 1:
+        results = dict(zip(jobs, map(_optimize_job, jobs)))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = dict(zip(jobs, executor.map(_optimize_job, jobs)))
+
+    optimized = {}
+    for (path, width), max_pixels in placements.items():
+        optimized[(path, width)] = result = results[(path, max_pixels, cache_dir, keep_format)]
+        if result != path:
+            _renditions[(path, width)] = result
+    return optimized
+
+
+def html_image_placements(html_content, images):
+    """Return (path, width) for every <img> in html_content found in images, at the width the DOCX builder uses."""
+    placements = []
+    for img in BeautifulSoup(html_content or '', 'html.parser').find_all('img'):
+        path = images.get(image_sys_id(img.get('src')))
+        if path:
+            width = DOCX_TABLE_IMAGE_WIDTH if img.find_parent('table') else DOCX_IMAGE_WIDTH
+            placements.append((path, width))
+    return placements
@@ -0,0 +1,121 @@
+import gzip
+import io
+import json
+import os
+
+import ndjson
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def open_text_output(path, compression=None, append=False):
+    """Open path for text writing, optionally through gzip or zstd."""
+    if append:
+        if compression:
+            raise ValueError("compressed streams cannot be appended to")
+        return open(path, 'a', encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            print("❌ zstd compression needs the 'zstandard' package (pip install zstandard)")
+            raise SystemExit(1)
+        stream = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def open_text_input(path):
+    """Open an NDJSON/JSON file for reading, picking the codec from its suffix."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            print("❌ Reading .zst files needs the 'zstandard' package (pip install zstandard)")
+            raise SystemExit(1)
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_ndjson(path):
+    with open_text_input(path) as f:
+        for record in ndjson.reader(f):
+            yield record
+
+
+class NDJSONWriter:
+    """Write records as one JSON object per line while pages arrive.
+
+    Each page is flushed (a sync flush when compressed) so downstream readers
+    can consume the file before the export finishes. resume_offset reopens an
+    uncompressed file from an interrupted run, cut back to that byte offset.
+    """
+
+    def __init__(self, path, compression=None, resume_offset=None):
+        self.path = path + COMPRESSION_SUFFIXES[compression]
+        self.compression = compression
+        self.count = 0
+        if resume_offset is not None:
+            with open(self.path, 'r+b') as f:
+                f.truncate(resume_offset)
+        self._file = open_text_output(self.path, compression, append=resume_offset is not None)
+        self._writer = ndjson.writer(self._file, ensure_ascii=False)
+
+    def write_records(self, records):
+        for record in records:
+            self._writer.writerow(record)
+        self._file.flush()
+        self.count += len(records)
+
+    def tell(self):
+        """Byte offset of the end of the last flushed page (uncompressed streams only)."""
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONResultWriter:
+    """Write records as a {"result": [...]} document, laid out like json.dump(..., indent=2), as they arrive.
+
+    The document is only complete once closed; leaving the with block on an
+    exception deletes the partial file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('{\n  "result": [')
+
+    def write_records(self, records):
+        for record in records:
+            text = json.dumps(record, indent=2)
+            self._file.write(',\n    ' if self.count else '\n    ')
+            self._file.write(text.replace('\n', '\n    '))
+            self.count += 1
+
+    def close(self):
+        self._file.write('\n  ]\n}' if self.count else ']\n}')
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self.path)
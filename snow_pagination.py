@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from snow_client import configure_pool, get_session, snow_url
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_WORKERS = 4
+
+
+def with_stable_order(query, order_field='sys_id'):
+    """Append a unique sort key so every offset addresses a fixed slice while the table is unchanged."""
+    if f"ORDERBY{order_field}" in (query or '') or f"ORDERBYDESC{order_field}" in (query or ''):
+        return query
+    return f"{query}^ORDERBY{order_field}" if query else f"ORDERBY{order_field}"
+
+
+def get_total_count(table, query=''):
+    """Return the number of rows matching query, via the aggregate API or X-Total-Count."""
+    session = get_session()
+    response = session.get(snow_url(f"api/now/stats/{table}"),
+                           params={'sysparm_count': 'true', 'sysparm_query': query})
+    if response.status_code == 200:
+        return int(response.json()['result']['stats']['count'])
+
+    # Aggregate API not permitted for this user: ask the table API for a single row and read the header
+    response = session.get(snow_url(f"api/now/table/{table}"),
+                           params={'sysparm_query': query, 'sysparm_fields': 'sys_id', 'sysparm_limit': 1})
+    response.raise_for_status()
+    return int(response.headers['X-Total-Count'])
+
+
+def fetch_page(table, params, limit, offset):
+    page_params = dict(params, sysparm_limit=limit, sysparm_offset=offset)
+    response = get_session().get(snow_url(f"api/now/table/{table}"), params=page_params)
+    response.raise_for_status()
+    return response.json().get('result', [])
+
+
+def iter_offset_pages(table, params=None, page_size=DEFAULT_PAGE_SIZE, max_workers=DEFAULT_WORKERS, total=None,
+                      skip_pages=()):
+    """Yield (page_number, records) for every row of table, in order.
+
+    Pages are fetched concurrently by a bounded worker pool but yielded in
+    offset order, so callers can write them sequentially. The query is sorted
+    on sys_id so every offset addresses a fixed slice of the table, and rows
+    already seen are dropped in case inserts shift rows across page borders.
+    Page numbers in skip_pages (already saved by an interrupted run) are
+    neither fetched nor yielded.
+
+    The walk is not guaranteed complete: a row deleted during the export
+    shifts every later row back one offset, so a row at a page border can be
+    skipped without any error. Only a short page or a final count below the
+    starting total hints at it. Use iter_keyset_pages (--mode keyset) when
+    every row present for the whole export must be covered.
+    """
+    params = dict(params or {})
+    params['sysparm_query'] = with_stable_order(params.get('sysparm_query', ''))
+    if total is None:
+        total = get_total_count(table, params['sysparm_query'])
+    page_count = -(-total // page_size)
+    print(f"📊 {table}: {total} record(s) in {page_count} page(s) of {page_size}")
+
+    configure_pool(max_workers)
+    seen = set()
+    window = max_workers * 2  # pages in flight; bounds memory held by out-of-order results
+
+    def unique(records):
+        fresh = []
+        for record in records:
+            sys_id = raw_value(record, 'sys_id')
+            if sys_id in seen:
+                continue
+            seen.add(sys_id)
+            fresh.append(record)
+        return fresh
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        next_submit = 0
+        last_count = 0
+        for page in range(page_count):
+            while next_submit < page_count and next_submit < page + window:
+                if next_submit + 1 not in skip_pages:
+                    futures[next_submit] = executor.submit(fetch_page, table, params, page_size,
+                                                           next_submit * page_size)
+                next_submit += 1
+            if page + 1 in skip_pages:
+                last_count = page_size
+                continue
+            records = futures.pop(page).result()
+            last_count = len(records)
+            if last_count < page_size and page < page_count - 1:
+                print(f"⚠️ Page {page + 1} returned {last_count} of {page_size} rows; rows were removed during the export "
+                      f"and later rows may have been skipped (use keyset mode for exact coverage)")
+            yield page + 1, unique(records)
+
+    # The table grew while we were reading: keep going until a short page
+    page = page_count
+    while last_count == page_size or (page_count == 0 and page == 0):
+        if page + 1 in skip_pages:
+            page += 1
+            continue
+        records = fetch_page(table, params, page_size, page * page_size)
+        last_count = len(records)
+        if not records:
+            break
+        page += 1
+        yield page, unique(records)
+
+    if len(seen) < total and not skip_pages:
+        print(f"⚠️ Exported {len(seen)} unique record(s); {total} matched when the export started. Rows deleted "
+              f"during the export shift later offsets, so some remaining rows may have been skipped; "
+              f"use keyset mode for exact coverage")
+    elif len(seen) != total and not skip_pages:
+        print(f"ℹ️ Exported {len(seen)} unique record(s); {total} matched when the export started")
+
+
+KEYSET_ORDER = "ORDERBYsys_updated_on^ORDERBYsys_id"
+
+
+def raw_value(record, field):
+    """Return the stored value of a field whether the record came back as display, raw or 'all'."""
+    value = record.get(field)
+    if isinstance(value, dict):
+        return value.get('value')
+    return value
+
+
+def record_key(record):
+    return raw_value(record, 'sys_updated_on'), raw_value(record, 'sys_id')
+
+
+def as_display_record(record):
+    """Reshape a sysparm_display_value=all record into the sysparm_display_value=true shape."""
+    shaped = {}
+    for field, value in record.items():
+        if isinstance(value, dict) and 'display_value' in value:
+            if 'link' in value:
+                shaped[field] = {'display_value': value['display_value'], 'link': value['link']}
+            else:
+                shaped[field] = value['display_value']
+        else:
+            shaped[field] = value
+    return shaped
+
+
+def keyset_query(base_query, after=None):
+    """Build an encoded query continuing strictly after the (sys_updated_on, sys_id) key."""
+    base = '^'.join(part for part in (base_query or '').split('^') if part and not part.startswith('ORDERBY'))
+    if after is None:
+        return f"{base}^{KEYSET_ORDER}" if base else KEYSET_ORDER
+
+    updated_on, sys_id = after
+    later = f"sys_updated_on>{updated_on}"
+    same_second = f"sys_updated_on={updated_on}^sys_id>{sys_id}"
+    if base:
+        return f"{base}^{later}^NQ{base}^{same_second}^{KEYSET_ORDER}"
+    return f"{later}^NQ{same_second}^{KEYSET_ORDER}"
+
+
+def iter_keyset_pages(table, params=None, page_size=DEFAULT_PAGE_SIZE, start_after=None, with_cursor=False):
+    """Yield (page_number, records) walking table in (sys_updated_on, sys_id) order.
+
+    Each page continues from the last key seen instead of an offset, so every
+    page costs the same however deep the export is, and rows updated during
+    the walk move behind the cursor rather than shifting pages. Such a row is
+    yielded again, with its new values, when the cursor reaches it, so the
+    last copy of a sys_id is the current one: upserting callers simply
+    overwrite, and readers of appended output should let later copies win.
+    Keys are raw UTC values, which assumes the integration user's time zone
+    is UTC (the norm for API accounts).
+    with_cursor adds the raw key to continue from as a third item, for
+    callers that checkpoint display-value pages.
+    """
+    params = dict(params or {})
+    display_value = params.get('sysparm_display_value', 'false')
+    if display_value == 'true':
+        # The cursor needs raw timestamps; fetch both and hand back the display shape
+        params['sysparm_display_value'] = 'all'
+    fields = params.get('sysparm_fields')
+    if fields:
+        missing = [field for field in ('sys_id', 'sys_updated_on') if field not in fields.split(',')]
+        params['sysparm_fields'] = ','.join([fields] + missing)
+    base_query = params.get('sysparm_query', '')
+
+    after = start_after
+    page = 0
+    while True:
+        params['sysparm_query'] = keyset_query(base_query, after)
+        records = fetch_page(table, params, page_size, 0)
+        if not records:
+            break
+
+        after = record_key(records[-1])
+        if display_value == 'true':
+            records = [as_display_record(record) for record in records]
+
+        page += 1
+        yield (page, records, after) if with_cursor else (page, records)
+        if len(records) < page_size:
+            break
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import queue
+import threading
+
+from snow_attachments import (DEFAULT_ATTACHMENT_WORKERS, PREFETCH_CHUNK_SIZE, default_cache, download_attachment,
+                              list_attachments, prefetch_attachment_index)
+from snow_async import DEFAULT_ASYNC_CONCURRENCY, AsyncSnowClient
+from snow_client import configure_pool
+from snow_pagination import raw_value
+
+DEFAULT_PDF_WORKERS = int(os.getenv('SNOW_PDF_WORKERS', '4'))
+# Jobs waiting per stage; the lister blocks once a stage falls this far behind
+DEFAULT_QUEUE_SIZE = 200
+
+_DONE = object()
+
+
+class _Stage:
+    """A bounded queue drained by a fixed number of worker threads."""
+
+    def __init__(self, name, handle, workers, queue_size):
+        self.name = name
+        self.handle = handle
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.succeeded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, *job):
+        self.jobs.put(job)
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is _DONE:
+                return
+            try:
+                ok = bool(self.handle(*job))
+            except Exception as e:
+                # One bad ticket must not take the worker (and the rest of the export) down with it
+                print(f"   ✗ {self.name} failed: {e}")
+                ok = False
+            with self._lock:
+                if ok:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+
+    def finish(self):
+        for _ in self._threads:
+            self.jobs.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+
+
+class _TicketProgress:
+    """Journals finished attachments and PDFs, and each ticket once all of its files are saved.
+
+    A ticket entry lists the files it covers, so a resumed run skips the
+    ticket (and its attachment listing) only while every one of them is
+    still intact.
+    """
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.skipped_files = 0
+        self.skipped_tickets = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def file_done(self, kind, key):
+        if self.checkpoint is not None and self.checkpoint.is_done(kind, key):
+            self.skipped_files += 1
+            return True
+        return False
+
+    def ticket_done(self, sys_id):
+        entry = self.checkpoint.entry('ticket', sys_id) if self.checkpoint is not None and sys_id else None
+        if entry is None or not all(self.checkpoint.is_done(kind, key) for kind, key in entry[1]):
+            return False
+        self.skipped_tickets += 1
+        return True
+
+    def expect(self, sys_id, files, pending):
+        if self.checkpoint is None:
+            return
+        self._pending[sys_id] = [files, pending]
+        if pending == 0:
+            self.checkpoint.mark_done('ticket', sys_id, info=files)
+
+    def finished(self, sys_id, kind, key, path):
+        if self.checkpoint is None:
+            return
+        self.checkpoint.mark_done(kind, key, path)
+        with self._lock:
+            self._pending[sys_id][1] -= 1
+            files, pending = self._pending[sys_id]
+        if pending == 0:
+            self.checkpoint.mark_done('ticket', sys_id, info=files)
+
+
+def _prepare_ticket_dirs(master_folder, ticket):
+    """Create <number>/Attachments and <number>/PDFs for a ticket; returns (sys_id, attachment_dir, pdf_dir)."""
+    sys_id = raw_value(ticket, "sys_id")
+    ticket_number = raw_value(ticket, "number") or sys_id
+    if not sys_id:
+        print("❌ Skipping ticket with missing sys_id")
+        return None
+
+    print(f"\n📥 Ticket: {ticket_number} (sys_id: {sys_id})")
+    base_dir = os.path.join(master_folder, ticket_number)
+    attachment_dir = os.path.join(base_dir, "Attachments")
+    pdf_dir = os.path.join(base_dir, "PDFs")
+    os.makedirs(attachment_dir, exist_ok=True)
+    os.makedirs(pdf_dir, exist_ok=True)
+    return sys_id, attachment_dir, pdf_dir
+
+
+def _pending_jobs(sys_id, attachments, progress):
+    """Drop the work an earlier run already finished; returns (attachments to fetch, whether the PDF is needed)."""
+    files = [('attachment', attachment.get('sys_id')) for attachment in attachments] + [('pdf', sys_id)]
+    attachments = [attachment for attachment in attachments
+                   if not progress.file_done('attachment', attachment.get('sys_id'))]
+    needs_pdf = not progress.file_done('pdf', sys_id)
+    progress.expect(sys_id, files, len(attachments) + needs_pdf)
+    return attachments, needs_pdf
+
+
+def _pdf_path(sys_id, pdf_dir):
+    return os.path.join(pdf_dir, f"{sys_id}.pdf")
+
+
+def _print_summary(stats):
+    print(f"\n✅ {stats['tickets']} ticket(s): {stats['attachments']} attachment(s) downloaded "
+          f"({stats['attachments_failed']} failed), {stats['pdfs']} PDF(s) saved ({stats['pdfs_failed']} failed)")
+    if stats['skipped_tickets'] or stats['skipped_files']:
+        print(f"⏭️ Skipped {stats['skipped_tickets']} ticket(s) and {stats['skipped_files']} other file(s) "
+              f"saved by an earlier run")
+
+
+def run_ticket_pipeline(tickets, master_folder, download_pdf, cache=None,
+                        attachment_workers=DEFAULT_ATTACHMENT_WORKERS, pdf_workers=DEFAULT_PDF_WORKERS,
+                        queue_size=DEFAULT_QUEUE_SIZE, checkpoint=None):
+    """Download the attachments and PDF of every ticket into master_folder/<number>/.
+
+    Tickets flow through three overlapping stages: a lister that creates the
+    folders and lists attachments 100 tickets at a time, a pool downloading
+    individual attachments and a pool rendering PDFs. Stages are joined by
+    bounded queues, so a slow stage throttles the lister instead of letting
+    pending work pile up in memory. download_pdf(sys_id, pdf_dir) saves
+    <pdf_dir>/<sys_id>.pdf and returns True on success. With a checkpoint,
+    finished files are journalled and files it already holds are skipped.
+    Returns the per-stage success and failure counts.
+    """
+    cache = cache or default_cache()
+    progress = _TicketProgress(checkpoint)
+
+    def fetch_attachment(attachment, output_dir, sys_id):
+        downloaded = download_attachment(attachment, output_dir, sys_id, cache)
+        if downloaded:
+            progress.finished(sys_id, 'attachment', attachment.get('sys_id'), downloaded['file_path'])
+        return downloaded
+
+    def fetch_pdf(sys_id, pdf_dir):
+        saved = download_pdf(sys_id, pdf_dir)
+        if saved:
+            progress.finished(sys_id, 'pdf', sys_id, _pdf_path(sys_id, pdf_dir))
+        return saved
+
+    attachments_stage = _Stage('attachment', fetch_attachment, attachment_workers, queue_size)
+    pdf_stage = _Stage('PDF', fetch_pdf, pdf_workers, queue_size)
+    configure_pool(attachment_workers + pdf_workers + 1)
+    attachments_stage.start()
+    pdf_stage.start()
+
+    queued = 0
+    try:
+        for start in range(0, len(tickets), PREFETCH_CHUNK_SIZE):
+            chunk = [ticket for ticket in tickets[start:start + PREFETCH_CHUNK_SIZE]
+                     if not progress.ticket_done(raw_value(ticket, "sys_id"))]
+            attachment_index = prefetch_attachment_index([raw_value(ticket, "sys_id") for ticket in chunk], max_workers=1)
+
+            for ticket in chunk:
+                prepared = _prepare_ticket_dirs(master_folder, ticket)
+                if prepared is None:
+                    continue
+                sys_id, attachment_dir, pdf_dir = prepared
+
+                attachments = attachment_index.get(sys_id)
+                if attachments is None:
+                    attachments = list_attachments(sys_id) or []
+                attachments, needs_pdf = _pending_jobs(sys_id, attachments, progress)
+                for attachment in attachments:
+                    attachments_stage.put(attachment, attachment_dir, sys_id)
+                if needs_pdf:
+                    pdf_stage.put(sys_id, pdf_dir)
+                queued += 1
+    finally:
+        attachments_stage.finish()
+        pdf_stage.finish()
+
+    stats = {
+        'tickets': queued,
+        'attachments': attachments_stage.succeeded,
+        'attachments_failed': attachments_stage.failed,
+        'pdfs': pdf_stage.succeeded,
+        'pdfs_failed': pdf_stage.failed,
+        'skipped_tickets': progress.skipped_tickets,
+        'skipped_files': progress.skipped_files
+    }
+    _print_summary(stats)
+    return stats
+
+
+async def _download_pdf(client, pdf_url, sys_id, pdf_dir):
+    file_path = _pdf_path(sys_id, pdf_dir)
+    response = await client.download_to_file(pdf_url(sys_id), file_path)
+    if response.status_code == 200:
+        print(f"   ✓ PDF successfully saved as {file_path}")
+        return True
+    print(f"   ✗ Failed to download PDF for sys_id {sys_id}. Status: {response.status_code}")
+    return False
+
+
+async def arun_ticket_pipeline(tickets, master_folder, pdf_url, cache=None, concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                               queue_size=DEFAULT_QUEUE_SIZE, checkpoint=None):
+    """Asyncio version of run_ticket_pipeline: concurrency tasks share one bounded job queue.
+
+    pdf_url(sys_id) returns the ticket's PDF export URL. Attachment and PDF
+    jobs are interleaved on one event loop, so thousands can be in flight
+    without a thread each.
+    """
+    cache = cache or default_cache()
+    progress = _TicketProgress(checkpoint)
+    stats = {'tickets': 0, 'attachments': 0, 'attachments_failed': 0, 'pdfs': 0, 'pdfs_failed': 0}
+    jobs = asyncio.Queue(maxsize=queue_size)
+
+    async with AsyncSnowClient(concurrency) as client:
+        async def work():
+            while True:
+                job = await jobs.get()
+                if job is None:
+                    return
+                kind, args = job
+                try:
+                    if kind == 'attachments':
+                        attachment, output_dir, sys_id = args
+                        downloaded = await client.download_attachment(attachment, output_dir, sys_id, cache=cache)
+                        if downloaded:
+                            progress.finished(sys_id, 'attachment', attachment.get('sys_id'), downloaded['file_path'])
+                        ok = downloaded is not None
+                    else:
+                        ok = await _download_pdf(client, pdf_url, *args)
+                        if ok:
+                            progress.finished(args[0], 'pdf', args[0], _pdf_path(*args))
+                except Exception as e:
+                    print(f"   ✗ {kind} job failed: {e}")
+                    ok = False
+                stats[kind if ok else f"{kind}_failed"] += 1
+
+        workers = [asyncio.ensure_future(work()) for _ in range(concurrency)]
+        try:
+            for start in range(0, len(tickets), PREFETCH_CHUNK_SIZE):
+                chunk = [ticket for ticket in tickets[start:start + PREFETCH_CHUNK_SIZE]
+                         if not progress.ticket_done(raw_value(ticket, "sys_id"))]
+                attachment_index = await client.prefetch_attachment_index(raw_value(ticket, "sys_id") for ticket in chunk)
+
+                for ticket in chunk:
+                    prepared = _prepare_ticket_dirs(master_folder, ticket)
+                    if prepared is None:
+                        continue
+                    sys_id, attachment_dir, pdf_dir = prepared
+
+                    attachments = attachment_index.get(sys_id)
+                    if attachments is None:
+                        attachments = await client.list_attachments(sys_id) or []
+                    attachments, needs_pdf = _pending_jobs(sys_id, attachments, progress)
+                    for attachment in attachments:
+                        await jobs.put(('attachments', (attachment, attachment_dir, sys_id)))
+                    if needs_pdf:
+                        await jobs.put(('pdfs', (sys_id, pdf_dir)))
+                    stats['tickets'] += 1
+        finally:
+            for _ in workers:
+                await jobs.put(None)
+            await asyncio.gather(*workers)
+
+    stats['skipped_tickets'] = progress.skipped_tickets
+    stats['skipped_files'] = progress.skipped_files
+    _print_summary(stats)
+    return stats
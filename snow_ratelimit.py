@@ -0,0 +1,252 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Upper bound on concurrent requests to one host; the limiter starts here and backs off on throttling
+MAX_CONCURRENCY = int(os.getenv('SNOW_MAX_CONCURRENCY', '64'))
+MAX_RETRIES = int(os.getenv('SNOW_MAX_RETRIES', '5'))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+# 429/503 mean the host wants less traffic; 502/504 are usually a busy node behind the load balancer
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = THROTTLE_STATUSES | {502, 504}
+# Only these are re-sent after a 5xx or a dropped connection; a 429 was rejected before processing, so any method is
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: a random delay up to BACKOFF_BASE * 2**attempt, capped."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_delay(method, status_code, headers, attempt):
+    """Return how long to wait before re-sending a request that got status_code, or None not to retry."""
+    if status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+        return None
+    if status_code != 429 and method.upper() not in IDEMPOTENT_METHODS:
+        return None
+    retry_after = _parse_retry_after(headers.get('Retry-After'))
+    if retry_after is not None:
+        # Spread the retries of everything that was throttled at once
+        return retry_after + random.uniform(0, 1)
+    return backoff_delay(attempt)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one host, shared by threads and asyncio tasks.
+
+    Requests wait in one FIFO queue for a slot. Each success raises the limit
+    by 1/limit (about +1 per round trip of the whole window), each throttled
+    response halves it at most once per Retry-After window, and Retry-After
+    or an exhausted X-RateLimit-Remaining pauses the host until it may be
+    called again. Throughput therefore settles just under the instance's
+    rate-limit rules instead of oscillating between bursts and 429 storms.
+    """
+
+    def __init__(self, max_limit=MAX_CONCURRENCY, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._timer = None
+
+    def _grant_locked(self):
+        now = time.monotonic()
+        if now < self._paused_until:
+            if self._waiters and self._timer is None:
+                self._timer = threading.Timer(self._paused_until - now, self._resume)
+                self._timer.daemon = True
+                self._timer.start()
+            return
+        while self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self._waiters.popleft()()
+
+    def _resume(self):
+        with self._lock:
+            self._timer = None
+            self._grant_locked()
+
+    def acquire(self):
+        granted = threading.Event()
+        with self._lock:
+            self._waiters.append(granted.set)
+            self._grant_locked()
+        granted.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            self._waiters.append(grant)
+            self._grant_locked()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(grant)
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_locked()
+
+    def record(self, status_code, headers):
+        """Adjust the limit from a response's status and X-RateLimit-*/Retry-After headers."""
+        now = time.monotonic()
+        with self._lock:
+            if status_code in THROTTLE_STATUSES:
+                retry_after = _parse_retry_after(headers.get('Retry-After'))
+                window = retry_after if retry_after is not None else 1.0
+                if now - self._last_decrease >= window and self.limit > self.min_limit:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+                    print(f"🚦 Throttled ({status_code}); concurrency limit lowered to {int(self.limit)}")
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            elif status_code < 500:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset = headers.get('X-RateLimit-Reset')
+            if remaining is not None and reset is not None and remaining.isdigit() and int(remaining) == 0:
+                try:
+                    # Reset is an epoch timestamp on ServiceNow; treat small values as seconds from now
+                    reset = float(reset)
+                    wait = reset - time.time() if reset > 1e9 else reset
+                    self._paused_until = max(self._paused_until, now + max(0.0, wait))
+                except ValueError:
+                    pass
+
+
+def limiter_for(url):
+    """Return the process-wide limiter for url's host."""
+    host = urlparse(url).netloc
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = AdaptiveLimiter()
+        return _limiters[host]
+
+
+def _slot_releaser(limiter):
+    """Return a callable that gives back one limiter slot the first time it is called."""
+    lock = threading.Lock()
+    held = [True]
+
+    def release():
+        with lock:
+            if not held[0]:
+                return
+            held[0] = False
+        limiter.release()
+    return release
+
+
+def hold_slot_until_closed(response, limiter):
+    """Keep a streamed requests response's slot until its body is read to the end or it is closed.
+
+    urllib3 calls release_conn once the body is exhausted and Response.close
+    calls it too; a response dropped unread gives the slot back when it is
+    garbage-collected.
+    """
+    release = _slot_releaser(limiter)
+    raw = response.raw
+    release_conn = getattr(raw, 'release_conn', None)
+    close = response.close
+
+    def release_conn_and_slot():
+        try:
+            if release_conn is not None:
+                release_conn()
+        finally:
+            release()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+
+    raw.release_conn = release_conn_and_slot
+    response.close = close_and_release
+    weakref.finalize(response, release)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that sends through the host's AdaptiveLimiter and retries throttled or failed requests.
+
+    A stream=True response keeps its slot until the body has been read or
+    the response closed, so the limit also caps downloads in progress.
+    """
+
+    def send(self, request, **kwargs):
+        limiter = limiter_for(request.url)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                limiter.release()
+                if attempt >= MAX_RETRIES or request.method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"⚠️ {type(e).__name__} on {urlparse(request.url).path}; retrying in {delay:.1f}s")
+            else:
+                limiter.record(response.status_code, response.headers)
+                delay = retry_delay(request.method, response.status_code, response.headers, attempt)
+                if delay is None:
+                    if kwargs.get('stream'):
+                        hold_slot_until_closed(response, limiter)
+                    else:
+                        limiter.release()
+                    return response
+                limiter.release()
+                # Release the connection before waiting
+                response.content
+                response.close()
+                print(f"⏳ {response.status_code} on {urlparse(request.url).path}; retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{MAX_RETRIES})")
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,191 @@
+import datetime
+import queue
+import threading
+
+from snow_client import configure_pool, get_session, snow_url
+from snow_pagination import DEFAULT_PAGE_SIZE, get_total_count, iter_keyset_pages, raw_value
+
+SHARD_FIELD = 'sys_created_on'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Ranges counted per shard while balancing; more buckets even out the shards at one stats call each
+BUCKETS_PER_SHARD = 8
+
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value, TIME_FORMAT)
+
+
+def _format_time(value):
+    return value.strftime(TIME_FORMAT)
+
+
+def range_query(start=None, end=None):
+    """Encoded query for start <= sys_created_on < end; either end may be open (None)."""
+    parts = []
+    if start:
+        parts.append(f"{SHARD_FIELD}>={start}")
+    if end:
+        parts.append(f"{SHARD_FIELD}<{end}")
+    return '^'.join(parts)
+
+
+def _and_query(base_query, extra):
+    base = '^'.join(part for part in (base_query or '').split('^') if part and not part.startswith('ORDERBY'))
+    return '^'.join(part for part in (base, extra) if part)
+
+
+def created_range(table, query=''):
+    """Return the oldest and newest raw sys_created_on matching query, or None if nothing matches."""
+    session = get_session()
+    response = session.get(snow_url(f"api/now/stats/{table}"),
+                           params={'sysparm_query': query, 'sysparm_min_fields': SHARD_FIELD,
+                                   'sysparm_max_fields': SHARD_FIELD})
+    if response.status_code == 200:
+        stats = response.json()['result']['stats']
+        oldest, newest = stats.get('min', {}).get(SHARD_FIELD), stats.get('max', {}).get(SHARD_FIELD)
+        return (oldest, newest) if oldest and newest else None
+
+    # Aggregate API not permitted for this user: read the first row from each end of the table
+    def edge(order):
+        response = session.get(snow_url(f"api/now/table/{table}"),
+                               params={'sysparm_query': _and_query(query, f"{order}{SHARD_FIELD}"),
+                                       'sysparm_fields': SHARD_FIELD, 'sysparm_limit': 1})
+        response.raise_for_status()
+        rows = response.json().get('result', [])
+        return rows[0][SHARD_FIELD] if rows else None
+
+    oldest, newest = edge('ORDERBY'), edge('ORDERBYDESC')
+    return (oldest, newest) if oldest and newest else None
+
+
+def plan_shards(table, query='', shards=4):
+    """Split the rows matching query into up to `shards` sys_created_on ranges of about equal size.
+
+    The span between the oldest and newest row is bisected, always splitting
+    the fullest range and counting it through the aggregate API, until there
+    are BUCKETS_PER_SHARD ranges per shard; adjacent ranges are then grouped
+    so each shard holds about total / shards rows. The first shard is open
+    towards the past and the last towards the future, so rows created
+    during the export still land in a shard. Returns a list of
+    {'start', 'end', 'count'} dicts with raw UTC bounds (start inclusive,
+    end exclusive).
+    """
+    total = get_total_count(table, query)
+    bounds = created_range(table, query) if shards > 1 and total > 1 else None
+    if bounds is None:
+        return [{'start': None, 'end': None, 'count': total}]
+
+    oldest = _parse_time(bounds[0])
+    newest = _parse_time(bounds[1]) + datetime.timedelta(seconds=1)
+    buckets = [(oldest, newest, total)]
+    while len(buckets) < shards * BUCKETS_PER_SHARD:
+        # Split the fullest range that is still at least two seconds wide
+        splittable = [i for i, (start, end, count) in enumerate(buckets)
+                      if count > 1 and (end - start).total_seconds() >= 2]
+        if not splittable:
+            break
+        i = max(splittable, key=lambda j: buckets[j][2])
+        start, end, count = buckets[i]
+        middle = start + datetime.timedelta(seconds=int((end - start).total_seconds() // 2))
+        left = get_total_count(table, _and_query(query, range_query(_format_time(start), _format_time(middle))))
+        buckets[i:i + 1] = [(start, middle, left), (middle, end, count - left)]
+
+    # Cut between buckets wherever the running count comes closest to the next multiple of total / shards
+    target = total / shards
+    plan = []
+    start, running, shard_count = None, 0, 0
+    for i, (_, end, count) in enumerate(buckets):
+        running += count
+        shard_count += count
+        last = i == len(buckets) - 1
+        next_count = 0 if last else buckets[i + 1][2]
+        goal = (len(plan) + 1) * target
+        if not last and len(plan) < shards - 1 and abs(running - goal) <= abs(running + next_count - goal):
+            if shard_count:
+                plan.append({'start': start, 'end': _format_time(end), 'count': shard_count})
+                start, shard_count = _format_time(end), 0
+    plan.append({'start': start, 'end': None, 'count': shard_count})
+    return plan
+
+
+def iter_sharded_pages(table, params=None, plan=None, page_size=DEFAULT_PAGE_SIZE, max_workers=4, cursors=None,
+                       done_shards=()):
+    """Yield (shard, records, cursor) pages from every shard of plan, exported concurrently.
+
+    Each shard walks its own sys_created_on range with a keyset cursor
+    (iter_keyset_pages), max_workers shards at a time; pages are handed over
+    through a bounded queue as they arrive, so shards interleave. A row
+    already yielded by another shard is dropped; within a shard a row
+    updated mid-export comes through again with its new values, as with
+    iter_keyset_pages, and the later copy wins. A shard's last page is
+    followed by (shard, None, None) to mark it complete. cursors maps a
+    shard to the key an interrupted run stopped after; shards in
+    done_shards are skipped.
+    """
+    params = dict(params or {})
+    base_query = params.get('sysparm_query', '')
+    cursors = cursors or {}
+    pending = [shard for shard in range(len(plan)) if shard not in done_shards]
+    max_workers = max(1, min(max_workers, len(pending) or 1))
+    configure_pool(max_workers)
+
+    pages = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+    claim = threading.Lock()
+    done = object()
+
+    def work():
+        try:
+            while not stop.is_set():
+                with claim:
+                    if not pending:
+                        break
+                    shard = pending.pop(0)
+                spec = plan[shard]
+                shard_params = dict(params, sysparm_query=_and_query(base_query,
+                                                                     range_query(spec['start'], spec['end'])))
+                start_after = tuple(cursors[shard]) if cursors.get(shard) else None
+                for _, records, after in iter_keyset_pages(table, shard_params, page_size=page_size,
+                                                           start_after=start_after, with_cursor=True):
+                    pages.put((shard, records, after))
+                    if stop.is_set():
+                        return
+                pages.put((shard, None, None))
+            pages.put(done)
+        except BaseException as e:
+            pages.put(e)
+
+    threads = [threading.Thread(target=work, name=f"shard-{table}-{i}", daemon=True) for i in range(max_workers)]
+    for thread in threads:
+        thread.start()
+
+    # sys_id -> the shard that yielded it; sys_created_on never changes, so a row stays in its shard
+    seen = {}
+    running = len(threads)
+    try:
+        while running:
+            item = pages.get()
+            if item is done:
+                running -= 1
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            shard, records, after = item
+            if records is None:
+                yield shard, None, None
+                continue
+            fresh = []
+            for record in records:
+                sys_id = raw_value(record, 'sys_id')
+                if seen.setdefault(sys_id, shard) != shard:
+                    continue
+                fresh.append(record)
+            yield shard, fresh, after
+    finally:
+        stop.set()
+        # Unblock producers waiting on a full queue so the threads can exit
+        while any(thread.is_alive() for thread in threads):
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,144 @@
+import json
+import sqlite3
+
+from snow_pagination import raw_value
+
+# Columns pulled out of each record so subsets can be selected without parsing the JSON
+INDEXED_FIELDS = ('number', 'state', 'sys_updated_on', 'assignment_group')
+
+
+def display_value(record, field):
+    """Return the display value of a field whether the record came back as display, raw or 'all'."""
+    value = record.get(field)
+    if isinstance(value, dict):
+        return value.get('display_value', value.get('value'))
+    return value
+
+
+class RecordStore:
+    """Local SQLite copy of ServiceNow records, keyed by table and sys_id.
+
+    Besides the raw JSON, number, sys_updated_on (raw value), state and
+    assignment_group (display values, as people filter on them) are kept in
+    indexed columns, so downstream scripts can select subsets such as open
+    cases updated this week without loading the whole table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                table_name TEXT NOT NULL,
+                sys_id TEXT NOT NULL,
+                sys_updated_on TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (table_name, sys_id)
+            )
+        """)
+        self._add_indexed_columns()
+        self.conn.commit()
+
+    def _add_indexed_columns(self):
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(records)")}
+        added = [field for field in ('number', 'state', 'assignment_group') if field not in columns]
+        for field in added:
+            self.conn.execute(f"ALTER TABLE records ADD COLUMN {field} TEXT")
+        for field in INDEXED_FIELDS:
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS records_{field} ON records (table_name, {field})")
+        if added:
+            # Stores written before these columns existed: fill them in from the JSON
+            rows = self.conn.execute("SELECT table_name, sys_id, data FROM records").fetchall()
+            self.conn.executemany(
+                "UPDATE records SET number = ?, state = ?, assignment_group = ? WHERE table_name = ? AND sys_id = ?",
+                [self._extra_columns(json.loads(data)) + (table, sys_id) for table, sys_id, data in rows])
+
+    @staticmethod
+    def _extra_columns(record):
+        return raw_value(record, 'number'), display_value(record, 'state'), display_value(record, 'assignment_group')
+
+    def upsert(self, table, records):
+        """Insert new records and replace older copies; returns the number written."""
+        rows = [
+            (table, raw_value(record, 'sys_id'), raw_value(record, 'sys_updated_on'), json.dumps(record))
+            + self._extra_columns(record)
+            for record in records
+        ]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO records (table_name, sys_id, sys_updated_on, data, number, state, assignment_group)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (table_name, sys_id) DO UPDATE SET
+                    sys_updated_on = excluded.sys_updated_on,
+                    data = excluded.data,
+                    number = excluded.number,
+                    state = excluded.state,
+                    assignment_group = excluded.assignment_group
+            """, rows)
+        return len(rows)
+
+    def count(self, table):
+        return self.conn.execute("SELECT COUNT(*) FROM records WHERE table_name = ?", (table,)).fetchone()[0]
+
+    def iter_records(self, table):
+        cursor = self.conn.execute("SELECT data FROM records WHERE table_name = ? ORDER BY sys_id", (table,))
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def get_records(self, table, sys_ids):
+        """Yield the stored records of table with the given sys_ids, looked up by primary key."""
+        sys_ids = list(sys_ids)
+        # Stay under SQLite's default limit on bound parameters
+        for start in range(0, len(sys_ids), 500):
+            chunk = sys_ids[start:start + 500]
+            cursor = self.conn.execute(
+                f"SELECT data FROM records WHERE table_name = ? AND sys_id IN ({', '.join('?' * len(chunk))})",
+                [table] + chunk)
+            for (data,) in cursor:
+                yield json.loads(data)
+
+    def query(self, table, state=None, assignment_group=None, number=None, updated_since=None, updated_before=None,
+              limit=None):
+        """Yield the records of table matching every given filter, newest update first.
+
+        state, assignment_group and number accept one value or a list of
+        values; updated_since/updated_before compare against the raw
+        sys_updated_on ('YYYY-MM-DD HH:MM:SS', UTC).
+        """
+        clauses = ["table_name = ?"]
+        args = [table]
+        for field, wanted in (('state', state), ('assignment_group', assignment_group), ('number', number)):
+            if wanted is None:
+                continue
+            values = [wanted] if isinstance(wanted, str) else list(wanted)
+            clauses.append(f"{field} IN ({', '.join('?' * len(values))})")
+            args.extend(values)
+        if updated_since:
+            clauses.append("sys_updated_on >= ?")
+            args.append(updated_since)
+        if updated_before:
+            clauses.append("sys_updated_on < ?")
+            args.append(updated_before)
+        sql = f"SELECT data FROM records WHERE {' AND '.join(clauses)} ORDER BY sys_updated_on DESC, sys_id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        for (data,) in self.conn.execute(sql, args):
+            yield json.loads(data)
+
+    def close(self):
+        self.conn.close()
+
+
+def add_query_arguments(parser):
+    """Add the --state/--assignment-group/--number/--updated-since/--updated-before filters to an argparse parser."""
+    parser.add_argument('--state', action='append', help='Only records in this state (display value; repeatable)')
+    parser.add_argument('--assignment-group', action='append', help='Only records assigned to this group (repeatable)')
+    parser.add_argument('--number', action='append', help='Only these record numbers (repeatable)')
+    parser.add_argument('--updated-since', help="Only records updated at or after 'YYYY-MM-DD[ HH:MM:SS]' (UTC)")
+    parser.add_argument('--updated-before', help="Only records updated before 'YYYY-MM-DD[ HH:MM:SS]' (UTC)")
+
+
+def query_from_args(store, table, args):
+    return store.query(table, state=args.state, assignment_group=args.assignment_group, number=args.number,
+                       updated_since=args.updated_since, updated_before=args.updated_before)
@@ -0,0 +1,128 @@
+import codecs
+import json
+
+# Bytes read from the socket per step; a record split across two reads is decoded once the second arrives
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _TextBuffer:
+    """Decoded text of a byte stream, kept only from the current parse position onwards."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk, dropping text already consumed; returns False at end of stream."""
+        if self.eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            new = self._decoder.decode(b'', final=True)
+        else:
+            new = self._decoder.decode(chunk)
+        self.text = self.text[self.pos:] + new
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or None at end of stream."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.text, self.pos)
+        self.pos += 1
+
+    def decode(self, decoder):
+        """Decode the next complete JSON value, reading more of the stream until it is whole."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Read at least as much again before retrying, so a record many chunks long is
+                # re-scanned a logarithmic rather than linear number of times
+                wanted = 2 * (len(self.text) - self.pos)
+                if not self.fill():
+                    raise
+                while len(self.text) < wanted and self.fill():
+                    pass
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.text) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_array(buffer, decoder):
+    buffer.expect('[')
+    if buffer.peek() == ']':
+        buffer.pos += 1
+        return
+    while True:
+        yield buffer.decode(decoder)
+        if buffer.peek() == ']':
+            buffer.pos += 1
+            return
+        buffer.expect(',')
+
+
+def iter_json_array_items(chunks, key='result'):
+    """Yield the items of the top-level object's key array from an iterator of byte chunks.
+
+    Only the record being decoded (plus one chunk) is held in memory, so
+    the size of a page no longer bounds what a worker can fetch. Other keys
+    of the object are decoded and discarded; a document that is itself an
+    array (such as a records_batch_*.json file) yields its items. Raises
+    json.JSONDecodeError on malformed or truncated input.
+    """
+    decoder = json.JSONDecoder()
+    buffer = _TextBuffer(iter(chunks))
+    if buffer.peek() == '[':
+        yield from _iter_array(buffer, decoder)
+        return
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        name = buffer.decode(decoder)
+        buffer.expect(':')
+        if name == key and buffer.peek() == '[':
+            yield from _iter_array(buffer, decoder)
+        else:
+            buffer.decode(decoder)
+        if buffer.peek() == '}':
+            return
+        buffer.expect(',')
+
+
+def iter_json_file_records(path, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the records of a saved table response or batch file without loading it whole."""
+    with open(path, 'rb') as f:
+        yield from iter_json_array_items(iter(lambda: f.read(chunk_size), b''))
+
+
+def iter_result_records(response, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the records of a Table API response's result array one at a time.
+
+    response must come from a request made with stream=True; the body is
+    decompressed and parsed as it arrives instead of through response.json().
+    """
+    try:
+        yield from iter_json_array_items(response.iter_content(chunk_size=chunk_size))
+    finally:
+        response.close()
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+from snow_pagination import DEFAULT_PAGE_SIZE, iter_keyset_pages
+from snow_store import RecordStore
+
+DEFAULT_STATE_FILE = 'sync_state.json'
+
+
+def load_high_water_mark(state_file, table):
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, 'r', encoding='utf-8') as f:
+        mark = json.load(f).get(table)
+    return (mark['sys_updated_on'], mark['sys_id']) if mark else None
+
+
+def save_high_water_mark(state_file, table, key):
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    state[table] = {'sys_updated_on': key[0], 'sys_id': key[1]}
+
+    tmp_path = f"{state_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_file)
+
+
+def sync_table(table, params, store_path, state_file=DEFAULT_STATE_FILE, page_size=DEFAULT_PAGE_SIZE):
+    """Pull records changed since the table's high-water mark and merge them into the store.
+
+    Records are requested with sysparm_display_value=all so the store keeps both
+    raw and display values, and the mark is the raw (sys_updated_on, sys_id)
+    key of the last merged record. A row updated during the walk is read
+    again further on and the newer copy overwrites the older one. The mark
+    is saved after every page, so an interrupted sync picks up where it
+    stopped. The first run is a full export.
+    """
+    start_time = time.time()
+    params = dict(params, sysparm_display_value='all')
+    mark = load_high_water_mark(state_file, table)
+    if mark:
+        print(f"🔁 {table}: fetching records changed after {mark[0]} (sys_id {mark[1]})")
+    else:
+        print(f"🆕 {table}: no high-water mark in {state_file}, running a full export")
+
+    store = RecordStore(store_path)
+    merged = 0
+    try:
+        for page, records, mark in iter_keyset_pages(table, params, page_size=page_size, start_after=mark,
+                                                     with_cursor=True):
+            merged += store.upsert(table, records)
+            save_high_water_mark(state_file, table, mark)
+            print(f"📥 Page {page}: merged {len(records)} record(s), high-water mark {mark[0]}")
+        total = store.count(table)
+    finally:
+        store.close()
+
+    minutes, seconds = divmod(time.time() - start_time, 60)
+    print(f"\n✅ {table}: {merged} changed record(s) merged, {total} in {store_path}")
+    print(f"⏱️ Total time taken: {int(minutes)} minutes, {int(seconds)} seconds")
+    return merged
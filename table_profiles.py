@@ -0,0 +1,101 @@
+# Declarative field profiles per table. Each profile drives sysparm_fields,
+# sysparm_exclude_reference_link and sysparm_display_value ("true", "false" or
+# "all"); a profile without fields returns full rows.
+
+# Every field read by format_kb_article_to_docx / create_confluence_content, plus the article body
+KB_ARTICLE_FIELDS = [
+    'number', 'sys_created_on', 'sys_updated_on', 'workflow_state', 'text', 'sys_updated_by',
+    'sys_domain', 'x_caukp_ebonding_no_return', 'u_select_portal', 'sys_created_by', 'published',
+    'author', 'x_caukp_ebonding_integration_mode', 'helpful_count', 'sys_domain_path',
+    'u_view_count_all', 'version', 'active', 'topic', 'valid_to', 'kb_category', 'meta_description',
+    'kb_knowledge_base', 'meta', 'u_problem_type', 'display_number', 'base_version',
+    'short_description', 'direct', 'disable_suggesting', 'sys_class_name', 'article_id', 'sys_id',
+    'use_count', 'flagged', 'disable_commenting', 'u_add_to_homepage', 'display_attachments',
+    'latest', 'summary', 'sys_view_count', 'revised_by', 'article_type', 'u_needs_review',
+    'sys_mod_count', 'view_as_allowed', 'category', 'u_reminder_send_date', 'wiki', 'rating',
+    'source', 'x_caukp_ebonding_sdc', 'scheduled_publish_date', 'image', 'u_kbi_uniqueid',
+    'cmdb_ci', 'can_read_user_criteria', 'cannot_read_user_criteria',
+    'x_caukp_ebonding_requester_id', 'u_last_review_date', 'x_caukp_ebonding_provider_id', 'roles',
+    'description', 'sn_grc_target_table', 'retired', 'u_video_url', 'sn_grc_source', 'sys_tags',
+    'replacement_article', 'x_caukp_ebonding_provider', 'taxonomy_topic',
+    'x_caukp_ebonding_requester', 'ownership_group',
+]
+
+TICKET_SUMMARY_FIELDS = [
+    'sys_id', 'number', 'state', 'short_description', 'priority', 'opened_at', 'opened_by', 'assigned_to',
+    'assignment_group', 'sys_created_on', 'sys_updated_on', 'closed_at',
+]
+
+FULL_PROFILE = {'display_value': 'true', 'view': 'Default view'}
+
+FIELD_PROFILES = {
+    'sn_hr_core_case': {
+        'full': FULL_PROFILE,
+        'summary': {'fields': TICKET_SUMMARY_FIELDS, 'exclude_reference_link': True, 'display_value': 'true'},
+        'ids': {'fields': ['sys_id', 'number'], 'exclude_reference_link': True, 'display_value': 'false'},
+    },
+    'x_llusn_bankg_bi_req': {
+        'full': FULL_PROFILE,
+        'summary': {'fields': TICKET_SUMMARY_FIELDS, 'exclude_reference_link': True, 'display_value': 'true'},
+        'ids': {'fields': ['sys_id', 'number'], 'exclude_reference_link': True, 'display_value': 'false'},
+    },
+    'sc_req_item': {
+        'full': FULL_PROFILE,
+        'summary': {'fields': TICKET_SUMMARY_FIELDS, 'exclude_reference_link': True, 'display_value': 'true'},
+        'ids': {'fields': ['sys_id', 'number'], 'exclude_reference_link': True, 'display_value': 'false'},
+    },
+    'kb_knowledge': {
+        'full': {'display_value': 'true'},
+        'docx': {'fields': KB_ARTICLE_FIELDS, 'exclude_reference_link': True, 'display_value': 'true'},
+    },
+}
+
+
+# Ticket tables the export scripts know, by the short name used on the command line. folder_prefix names
+# the <prefix>_<timestamp> export folders and the default <prefix>_store.db record store; the ticket PDF
+# is rendered by <pdf_endpoint>?PDF in pdf_view.
+TABLES = {
+    'hr': {'table': 'sn_hr_core_case', 'folder_prefix': 'HR_Tickets', 'response_prefix': 'HR_response'},
+    'treasury': {'table': 'x_llusn_bankg_bi_req', 'folder_prefix': 'Treasury_Tickets',
+                 'response_prefix': 'Treasury_response'},
+    'ritm': {'table': 'sc_req_item', 'folder_prefix': 'RITM_Tickets', 'response_prefix': 'RITM_response'},
+}
+
+
+def table_names():
+    return sorted(TABLES)
+
+
+def table_profile(name):
+    """Return the registry entry for a short table name, with its defaults filled in."""
+    if name not in TABLES:
+        raise ValueError(f"Unknown table '{name}'; choose from {', '.join(table_names())}")
+    profile = dict(TABLES[name], name=name)
+    profile.setdefault('pdf_endpoint', f"{profile['table']}.do")
+    profile.setdefault('pdf_view', 'Default view')
+    profile.setdefault('store', f"{profile['folder_prefix']}_store.db")
+    return profile
+
+
+def profile_names(table):
+    return sorted(FIELD_PROFILES.get(table, {'full': FULL_PROFILE}))
+
+
+def profile_params(table, profile='full', display_value=None):
+    """Return the sysparm_* parameters for a table's field profile.
+
+    display_value overrides the profile's own mode when given.
+    """
+    profiles = FIELD_PROFILES.get(table, {'full': FULL_PROFILE})
+    if profile not in profiles:
+        raise ValueError(f"Unknown field profile '{profile}' for {table}; choose from {', '.join(sorted(profiles))}")
+    spec = profiles[profile]
+
+    params = {'sysparm_display_value': display_value or spec.get('display_value', 'true')}
+    if spec.get('fields'):
+        params['sysparm_fields'] = ','.join(spec['fields'])
+    if spec.get('exclude_reference_link'):
+        params['sysparm_exclude_reference_link'] = 'true'
+    if spec.get('view'):
+        params['sysparm_view'] = spec['view']
+    return params
@@ -0,0 +1,49 @@
+import pytest
+
+import snow_pagination
+
+
+class FakeTable:
+    """In-memory ServiceNow table answering the keyset queries iter_keyset_pages sends.
+
+    Only the sys_updated_on/sys_id terms of the encoded query are applied;
+    rows come back in (sys_updated_on, sys_id) order. before_fetch, if set,
+    is called with the number of the request about to be answered, so a
+    test can change rows part-way through a walk.
+    """
+
+    def __init__(self, rows=()):
+        self.rows = {}
+        self.requests = 0
+        self.before_fetch = None
+        for row in rows:
+            self.put(*row)
+
+    def put(self, sys_id, sys_updated_on, **fields):
+        self.rows[sys_id] = dict(fields, sys_id=sys_id, sys_updated_on=sys_updated_on)
+
+    @staticmethod
+    def _matches(row, group):
+        for term in group.split('^'):
+            for field in ('sys_updated_on', 'sys_id'):
+                if term.startswith(f"{field}>") and not row[field] > term[len(field) + 1:]:
+                    return False
+                if term.startswith(f"{field}=") and row[field] != term[len(field) + 1:]:
+                    return False
+        return True
+
+    def fetch_page(self, table, params, limit, offset):
+        self.requests += 1
+        if self.before_fetch:
+            self.before_fetch(self.requests)
+        groups = params.get('sysparm_query', '').split('^NQ')
+        rows = sorted((row for row in self.rows.values() if any(self._matches(row, g) for g in groups)),
+                      key=lambda row: (row['sys_updated_on'], row['sys_id']))
+        return [dict(row) for row in rows[offset:offset + limit]]
+
+
+@pytest.fixture
+def fake_table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(snow_pagination, 'fetch_page', table.fetch_page)
+    return table
@@ -0,0 +1,59 @@
+import asyncio
+import base64
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+import snow_async  # noqa: E402
+
+CONFLUENCE_URL = 'https://confluence.example.com'
+
+
+def test_confluence_upload_sends_basic_auth_through_mock_transport():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json={'results': [{'id': 'att1', 'title': 'image0.png'}]})
+
+    async def upload():
+        async with snow_async.AsyncSnowClient(concurrency=2) as client:
+            await client._client.aclose()
+            client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            return await client.request('POST', f"{CONFLUENCE_URL}/rest/api/content/42/child/attachment",
+                                        headers={'X-Atlassian-Token': 'no-check'},
+                                        files={'file': ('image0.png', b'\x89PNG\r\n\x1a\n', 'application/octet-stream')},
+                                        auth=('user', 'token'))
+
+    response = asyncio.run(upload())
+
+    assert response.status_code == 200
+    assert response.json()['results'][0]['id'] == 'att1'
+    assert len(seen) == 1
+    request = seen[0]
+    assert request.method == 'POST'
+    assert request.headers['Authorization'] == 'Basic ' + base64.b64encode(b'user:token').decode()
+    assert request.headers['X-Atlassian-Token'] == 'no-check'
+    assert b'filename="image0.png"' in request.read()
+
+
+def test_streamed_download_holds_slot_until_closed():
+    def handler(request):
+        return httpx.Response(200, content=b'x' * 1024)
+
+    async def download():
+        async with snow_async.AsyncSnowClient(concurrency=2) as client:
+            await client._client.aclose()
+            client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            url = f"{CONFLUENCE_URL}/download/attachments/42/file.bin"
+            limiter = snow_async.limiter_for(url)
+            response = await client._send('GET', url, stream=True)
+            held = limiter.in_flight
+            await response.aclose()
+            return held, limiter.in_flight
+
+    held, after = asyncio.run(download())
+
+    assert held == 1
+    assert after == 0
@@ -0,0 +1,63 @@
+import os
+
+from snow_checkpoint import Checkpoint, export_complete, latest_export_folder, remove_partial_files
+
+
+def test_entry_is_redone_when_its_file_changes(tmp_path):
+    folder = str(tmp_path)
+    page = tmp_path / 'records_batch_1.json'
+    page.write_text('[]')
+    checkpoint = Checkpoint(folder)
+    checkpoint.mark_done('page', 1, str(page), info={'records': 0})
+    checkpoint.mark_done('page', 2, info={'records': 5, 'cursor': ['2024-01-01 10:00:00', 'b']})
+
+    assert checkpoint.entry('page', 1) == (str(page), {'records': 0})
+    assert checkpoint.entry('page', 2)[1]['cursor'] == ['2024-01-01 10:00:00', 'b']
+    page.write_text('[{}]')
+    assert not checkpoint.is_done('page', 1)
+    assert checkpoint.is_done('page', 2)
+    assert set(checkpoint.entries('page')) == {'1', '2'}
+    checkpoint.close()
+
+
+def test_truncated_pdf_is_not_done(tmp_path):
+    pdf = tmp_path / 'a.pdf'
+    pdf.write_bytes(b'<html>')
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.mark_done('pdf', 'a', str(pdf))
+
+    assert not checkpoint.is_done('pdf', 'a')
+    checkpoint.close()
+
+
+def test_latest_export_folder_skips_other_exports_and_stops_at_a_finished_one(tmp_path):
+    prefix = str(tmp_path / 'HR_Tickets')
+
+    def export(timestamp, kind, complete=False):
+        folder = f"{prefix}_{timestamp}"
+        os.makedirs(folder)
+        checkpoint = Checkpoint(folder)
+        checkpoint.set_meta('export', kind)
+        if complete:
+            checkpoint.mark_complete()
+        checkpoint.close()
+        return folder
+
+    assert latest_export_folder(prefix, 'fetch') is None
+    unfinished = export('20240101_100000', 'fetch')
+    export('20240102_100000', 'tickets')
+    assert latest_export_folder(prefix, 'fetch') == unfinished
+    assert not export_complete(unfinished)
+
+    finished = export('20240103_100000', 'fetch', complete=True)
+    assert export_complete(finished)
+    assert latest_export_folder(prefix, 'fetch') is None
+
+
+def test_remove_partial_files(tmp_path):
+    (tmp_path / 'attachments').mkdir()
+    (tmp_path / 'attachments' / '.a.txt.1234abcd.part').write_bytes(b'x')
+    (tmp_path / 'b.pdf').write_bytes(b'%PDF-')
+
+    assert remove_partial_files(str(tmp_path)) == 1
+    assert os.listdir(tmp_path / 'attachments') == []
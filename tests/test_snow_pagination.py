@@ -0,0 +1,53 @@
+from snow_pagination import iter_keyset_pages, keyset_query
+
+
+def walk(table='incident', **kwargs):
+    return [(page, [r['sys_id'] for r in records]) for page, records in iter_keyset_pages(table, **kwargs)]
+
+
+def test_keyset_query_continues_after_key_within_the_same_second():
+    assert keyset_query('active=true', ('2024-01-01 10:00:00', 'b')) == (
+        "active=true^sys_updated_on>2024-01-01 10:00:00"
+        "^NQactive=true^sys_updated_on=2024-01-01 10:00:00^sys_id>b"
+        "^ORDERBYsys_updated_on^ORDERBYsys_id")
+
+
+def test_keyset_walk_splits_same_second_ties_across_pages(fake_table):
+    for sys_id in 'abcde':
+        fake_table.put(sys_id, '2024-01-01 10:00:00')
+    fake_table.put('f', '2024-01-01 10:00:01')
+
+    assert walk(page_size=2) == [(1, ['a', 'b']), (2, ['c', 'd']), (3, ['e', 'f'])]
+
+
+def test_keyset_walk_yields_the_newer_copy_of_a_row_updated_mid_walk(fake_table):
+    for i in range(6):
+        fake_table.put(f"id{i}", f"2024-01-01 10:00:0{i}", short_description='old')
+
+    def update_id0(request):
+        if request == 2:
+            fake_table.put('id0', '2024-01-01 11:00:00', short_description='new')
+    fake_table.before_fetch = update_id0
+
+    pages = list(iter_keyset_pages('incident', page_size=3, with_cursor=True))
+
+    assert [[r['sys_id'] for r in records] for _, records, _ in pages] == [
+        ['id0', 'id1', 'id2'], ['id3', 'id4', 'id5'], ['id0']]
+    assert pages[-1][1][0]['short_description'] == 'new'
+    assert pages[-1][2] == ('2024-01-01 11:00:00', 'id0')
+
+
+def test_keyset_walk_resumes_strictly_after_start_key(fake_table):
+    for i in range(4):
+        fake_table.put(f"id{i}", '2024-01-01 10:00:00')
+
+    assert walk(page_size=10, start_after=('2024-01-01 10:00:00', 'id1')) == [(1, ['id2', 'id3'])]
+
+
+def test_keyset_walk_returns_display_shape_for_display_value_true(fake_table):
+    fake_table.put('id0', '2024-01-01 10:00:00')
+    fake_table.rows['id0']['state'] = {'display_value': 'Open', 'value': '1'}
+
+    (_, records), = iter_keyset_pages('incident', params={'sysparm_display_value': 'true'})
+
+    assert records[0]['state'] == 'Open'
@@ -0,0 +1,67 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import snow_ratelimit
+
+BODY = b'x' * 64 * 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/file"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def session():
+    session = requests.Session()
+    session.mount('http://', snow_ratelimit.RateLimitedAdapter())
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def test_streamed_response_holds_slot_until_closed(server_url, session):
+    limiter = snow_ratelimit.limiter_for(server_url)
+    response = session.get(server_url, stream=True)
+    assert limiter.in_flight == 1
+    response.close()
+    assert limiter.in_flight == 0
+    response.close()
+    assert limiter.in_flight == 0
+
+
+def test_streamed_response_releases_slot_when_body_is_read(server_url, session):
+    limiter = snow_ratelimit.limiter_for(server_url)
+    with session.get(server_url, stream=True) as response:
+        assert b''.join(response.iter_content(8192)) == BODY
+        assert limiter.in_flight == 0
+    assert limiter.in_flight == 0
+
+
+def test_plain_response_releases_slot_on_return(server_url, session):
+    limiter = snow_ratelimit.limiter_for(server_url)
+    response = session.get(server_url)
+    assert response.content == BODY
+    assert limiter.in_flight == 0
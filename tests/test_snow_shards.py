@@ -0,0 +1,51 @@
+import datetime
+
+import snow_shards
+from snow_shards import plan_shards, range_query
+
+
+def test_range_query_bounds():
+    assert range_query('2024-01-01 00:00:00', '2024-02-01 00:00:00') == (
+        'sys_created_on>=2024-01-01 00:00:00^sys_created_on<2024-02-01 00:00:00')
+    assert range_query(None, '2024-02-01 00:00:00') == 'sys_created_on<2024-02-01 00:00:00'
+    assert range_query() == ''
+
+
+def fake_created(monkeypatch, created):
+    def count(table, query=''):
+        matching = created
+        for term in query.split('^'):
+            if term.startswith('sys_created_on>='):
+                matching = [c for c in matching if c >= term[len('sys_created_on>='):]]
+            elif term.startswith('sys_created_on<'):
+                matching = [c for c in matching if c < term[len('sys_created_on<'):]]
+        return len(matching)
+
+    monkeypatch.setattr(snow_shards, 'get_total_count', count)
+    monkeypatch.setattr(snow_shards, 'created_range', lambda table, query='': (min(created), max(created)))
+
+
+def test_plan_shards_covers_every_row_once_in_balanced_ranges(monkeypatch):
+    start = datetime.datetime(2024, 1, 1)
+    # Most rows were created in the last few days of the span
+    created = [(start + datetime.timedelta(days=day, minutes=i)).strftime('%Y-%m-%d %H:%M:%S')
+               for day, rows in ((0, 40), (30, 40), (58, 200), (59, 200)) for i in range(rows)]
+    fake_created(monkeypatch, created)
+
+    plan = plan_shards('incident', shards=4)
+
+    assert plan[0]['start'] is None and plan[-1]['end'] is None
+    assert [spec['end'] for spec in plan[:-1]] == [spec['start'] for spec in plan[1:]]
+    assert sum(spec['count'] for spec in plan) == len(created)
+    for spec in plan:
+        in_range = [c for c in created
+                    if (spec['start'] is None or c >= spec['start']) and (spec['end'] is None or c < spec['end'])]
+        assert len(in_range) == spec['count']
+    assert len(plan) == 4
+    assert max(spec['count'] for spec in plan) <= 2 * len(created) / 4
+
+
+def test_plan_shards_keeps_small_tables_in_one_shard(monkeypatch):
+    fake_created(monkeypatch, ['2024-01-01 00:00:00'])
+
+    assert plan_shards('incident', shards=4) == [{'start': None, 'end': None, 'count': 1}]
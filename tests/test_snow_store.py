@@ -0,0 +1,66 @@
+import pytest
+
+from snow_store import RecordStore
+
+
+def case(sys_id, updated_on, state, group='Service Desk', number=None):
+    # sysparm_display_value=all shape, as fetch_table and sync_table store it
+    return {'sys_id': {'display_value': sys_id, 'value': sys_id},
+            'number': {'display_value': number or sys_id.upper(), 'value': number or sys_id.upper()},
+            'sys_updated_on': {'display_value': f"{updated_on} local", 'value': updated_on},
+            'state': {'display_value': state, 'value': state.lower()},
+            'assignment_group': {'display_value': group, 'value': 'g1'}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordStore(str(tmp_path / 'store.db'))
+    yield store
+    store.close()
+
+
+def test_upsert_replaces_the_older_copy(store):
+    assert store.upsert('incident', [case('a', '2024-01-01 10:00:00', 'New'),
+                                     case('b', '2024-01-01 10:00:00', 'New')]) == 2
+    store.upsert('incident', [case('a', '2024-01-02 10:00:00', 'Closed')])
+
+    assert store.count('incident') == 2
+    records = {r['sys_id']['value']: r for r in store.iter_records('incident')}
+    assert records['a']['state']['display_value'] == 'Closed'
+    assert list(store.query('incident', state='New')) == [records['b']]
+
+
+def test_tables_are_kept_apart(store):
+    store.upsert('incident', [case('a', '2024-01-01 10:00:00', 'New')])
+    store.upsert('sc_req_item', [case('a', '2024-01-01 10:00:00', 'Open')])
+
+    assert store.count('incident') == store.count('sc_req_item') == 1
+    assert [r['state']['display_value'] for r in store.iter_records('sc_req_item')] == ['Open']
+
+
+def test_query_filters_on_indexed_columns_newest_first(store):
+    store.upsert('incident', [
+        case('a', '2024-01-01 10:00:00', 'New', group='Network'),
+        case('b', '2024-01-03 10:00:00', 'In Progress'),
+        case('c', '2024-01-02 10:00:00', 'New'),
+        case('d', '2024-01-04 10:00:00', 'Closed'),
+    ])
+
+    def ids(**filters):
+        return [r['sys_id']['value'] for r in store.query('incident', **filters)]
+
+    assert ids() == ['d', 'b', 'c', 'a']
+    assert ids(state=['New', 'In Progress']) == ['b', 'c', 'a']
+    assert ids(state='New', assignment_group='Service Desk') == ['c']
+    assert ids(number='A') == ['a']
+    assert ids(updated_since='2024-01-02 00:00:00', updated_before='2024-01-04 00:00:00') == ['b', 'c']
+    assert ids(limit=2) == ['d', 'b']
+
+
+def test_get_records_looks_up_sys_ids_in_chunks(store):
+    store.upsert('incident', [case(f"id{i:04d}", '2024-01-01 10:00:00', 'New') for i in range(1200)])
+    wanted = [f"id{i:04d}" for i in range(0, 1200, 2)] + ['missing']
+
+    found = sorted(r['sys_id']['value'] for r in store.get_records('incident', wanted))
+
+    assert found == wanted[:-1]
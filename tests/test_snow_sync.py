@@ -0,0 +1,71 @@
+import json
+
+from snow_store import RecordStore
+from snow_sync import load_high_water_mark, sync_table
+
+
+def stored(store_path, table='incident'):
+    store = RecordStore(store_path)
+    try:
+        return {record['sys_id']: record for record in store.iter_records(table)}
+    finally:
+        store.close()
+
+
+def test_sync_keeps_the_newer_copy_of_a_row_updated_mid_walk(fake_table, tmp_path):
+    store_path, state_file = str(tmp_path / 'store.db'), str(tmp_path / 'state.json')
+    for i in range(6):
+        fake_table.put(f"id{i}", f"2024-01-01 10:00:0{i}", short_description='old')
+
+    def update_id0(request):
+        if request == 2:
+            fake_table.put('id0', '2024-01-01 11:00:00', short_description='new')
+    fake_table.before_fetch = update_id0
+
+    sync_table('incident', {}, store_path, state_file=state_file, page_size=3)
+
+    assert stored(store_path)['id0']['short_description'] == 'new'
+    assert load_high_water_mark(state_file, 'incident') == ('2024-01-01 11:00:00', 'id0')
+
+    fake_table.before_fetch = None
+    fake_table.put('id3', '2024-01-01 12:00:00', short_description='newer')
+    assert sync_table('incident', {}, store_path, state_file=state_file, page_size=3) == 1
+    assert stored(store_path)['id3']['short_description'] == 'newer'
+
+
+def test_sync_resumes_from_the_saved_high_water_mark(fake_table, tmp_path):
+    store_path, state_file = str(tmp_path / 'store.db'), str(tmp_path / 'state.json')
+    for i in range(5):
+        fake_table.put(f"id{i}", '2024-01-01 10:00:00')
+
+    assert sync_table('incident', {}, store_path, state_file=state_file, page_size=2) == 5
+    with open(state_file, encoding='utf-8') as f:
+        assert json.load(f) == {'incident': {'sys_updated_on': '2024-01-01 10:00:00', 'sys_id': 'id4'}}
+
+    assert sync_table('incident', {}, store_path, state_file=state_file, page_size=2) == 0
+
+    fake_table.put('id1', '2024-01-02 09:00:00')
+    fake_table.put('id5', '2024-01-01 10:00:00')
+    assert sync_table('incident', {}, store_path, state_file=state_file, page_size=2) == 2
+    assert sorted(stored(store_path)) == ['id0', 'id1', 'id2', 'id3', 'id4', 'id5']
+    assert load_high_water_mark(state_file, 'incident') == ('2024-01-02 09:00:00', 'id1')
+
+
+def test_interrupted_sync_picks_up_after_the_last_saved_page(fake_table, tmp_path):
+    store_path, state_file = str(tmp_path / 'store.db'), str(tmp_path / 'state.json')
+    for i in range(6):
+        fake_table.put(f"id{i}", f"2024-01-01 10:00:0{i}")
+
+    def fail_third_page(request):
+        if request == 3:
+            raise ConnectionError('dropped')
+    fake_table.before_fetch = fail_third_page
+    try:
+        sync_table('incident', {}, store_path, state_file=state_file, page_size=2)
+    except ConnectionError:
+        pass
+    assert load_high_water_mark(state_file, 'incident') == ('2024-01-01 10:00:03', 'id3')
+
+    fake_table.before_fetch = None
+    assert sync_table('incident', {}, store_path, state_file=state_file, page_size=2) == 2
+    assert len(stored(store_path)) == 6